@@ -0,0 +1,124 @@
+"""
+Ensemble Kalman filter correcting simulated Lake George volumes with observed areas.
+
+An ensemble of the monthly model is advanced together, every member with its own random
+errors of the rainfall received and the water evaporated. At every month with an observed
+area, each member's volume is mapped to area with volume_to_area and the volumes are moved
+toward the observation by the Kalman gain of the ensemble (stochastic EnKF with perturbed
+observations). Members are numpy arrays, so the cost is one vectorized update per month.
+"""
+
+import collections
+
+import numpy as np
+
+from checkpoints import Checkpoint
+from evaporation import evaporation_rates
+from model import COMPLEX_EVAPORATION_FORMULA, largest_area
+from model_helpers import volume_to_area
+from profiling import instrument
+
+# mean and spread (standard deviation) of the volumes of every month after assimilation, mean area,
+# innovation (observed minus mean predicted area, nan where not observed) and the final ensemble state
+AssimilationResult = collections.namedtuple(
+    'AssimilationResult', ['mean', 'spread', 'area_mean', 'innovations', 'checkpoint'])
+
+# months whose random errors are drawn together
+BLOCK_MONTHS = 256
+
+
+@instrument(stage=True)
+def assimilate(data, observed_areas=None, members=500, evaporation_rate=None,
+               formula=COMPLEX_EVAPORATION_FORMULA, rainfall_error=0.2, evaporation_error=0.2,
+               observation_error=0.05, min_observation_error=1e5, initial_error=0.1, checkpoint=None, table=None,
+               seed=None):
+    """
+    Runs the simple or complex model as an ensemble, correcting volumes with observed areas
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    observed_areas : [float] - observed area of every month in square metres, nan where not observed,
+        data.area if None
+    members : [int] - number of ensemble members
+    evaporation_rate : [float] - constant evaporation rate (simple model), None for the complex model
+    formula : [EvaporationFormula] - evaporation formula of the complex model, see evaporation.py
+    rainfall_error : [float] - relative error of the rainfall received every month
+    evaporation_error : [float] - relative error of the water evaporated every month
+    observation_error : [float] - relative error of the observed areas
+    min_observation_error : [float] - smallest error of an observed area, in square metres
+    initial_error : [float] - relative error of data.volume[0], the first month's volume
+    checkpoint : [Checkpoint] - ensemble state of a month to resume from, like the checkpoint of an earlier
+        result, with one volume and surface area per member
+    table : [AreaTable] - optional lookup table of volume_to_area, see area_table
+    seed : [int] - seed of the random errors, for reproducible runs
+    Returns
+    -------
+    AssimilationResult - mean, spread and mean area of every month from the first (or checkpoint's) month,
+    innovations and the checkpoint of the last month
+    Raises ValueError if there are fewer than 2 members, the ensemble covariance needs at least 2
+    """
+    rng = np.random.default_rng(seed)
+    rainfall = np.asarray(data.rainfall, dtype=float)
+    if evaporation_rate is None:
+        rates = evaporation_rates(data, formula)
+    else:
+        rates = np.full(len(rainfall), float(evaporation_rate))
+    observed = np.asarray(data.area if observed_areas is None else observed_areas, dtype=float)
+    catchment_area = largest_area(data)
+    if checkpoint is None:
+        start = 0
+        volumes = np.maximum(data.volume[0] * (1 + initial_error * rng.standard_normal(members)), 0)
+    else:
+        start = checkpoint.month
+        # a checkpoint of a single simulation has one float volume
+        volumes = np.atleast_1d(np.array(checkpoint.volume, dtype=float))
+        members = len(volumes)
+    if members < 2:
+        raise ValueError("assimilation needs at least 2 members but has {}".format(members))
+    months = len(rainfall) - start
+    mean = np.empty(months)
+    spread = np.empty(months)
+    area_mean = np.empty(months)
+    innovations = np.full(months, np.nan)
+    # lognormal errors with mean 1, so rainfall received and evaporated water stay positive
+    rainfall_sigma = np.sqrt(np.log1p(rainfall_error ** 2))
+    evaporation_sigma = np.sqrt(np.log1p(evaporation_error ** 2))
+    received = rainfall * catchment_area
+    areas = None if checkpoint is None else np.atleast_1d(np.array(checkpoint.surface_area, dtype=float))
+    # random errors are drawn and ensemble statistics computed for a block of months at a time,
+    # which keeps the work done per month to a few array operations
+    block_volumes = np.empty((BLOCK_MONTHS, members))
+    block_areas = np.empty((BLOCK_MONTHS, members))
+    for block_start in range(0, months, BLOCK_MONTHS):
+        block = min(BLOCK_MONTHS, months - block_start)
+        rainfall_errors = rng.lognormal(-rainfall_sigma ** 2 / 2, rainfall_sigma, (block, members))
+        evaporation_errors = rng.lognormal(-evaporation_sigma ** 2 / 2, evaporation_sigma, (block, members))
+        observation_errors = rng.standard_normal((block, members))
+        for row in range(block):
+            i = block_start + row
+            month = start + i
+            if i > 0:
+                volumes = (volumes + received[month] * rainfall_errors[row]
+                           - rates[month] * areas * evaporation_errors[row])
+                np.maximum(volumes, 0, out=volumes)
+            # the month of a checkpoint was assimilated before it was kept
+            if not np.isnan(observed[month]) and (i > 0 or checkpoint is None):
+                predicted = volume_to_area(volumes, table)
+                error = max(observation_error * observed[month], min_observation_error)
+                predicted_mean = predicted.mean()
+                innovations[i] = observed[month] - predicted_mean
+                # Kalman gain of volume from the ensemble covariance of volume and predicted area
+                predicted_anomaly = predicted - predicted_mean
+                covariance = np.dot(volumes - volumes.mean(), predicted_anomaly) / (members - 1)
+                gain = covariance / (np.dot(predicted_anomaly, predicted_anomaly) / (members - 1) + error ** 2)
+                perturbed = observed[month] + error * observation_errors[row]
+                volumes = np.maximum(volumes + gain * (perturbed - predicted), 0)
+            areas = volume_to_area(volumes, table)
+            block_volumes[row] = volumes
+            block_areas[row] = areas
+        mean[block_start:block_start + block] = block_volumes[:block].mean(axis=1)
+        spread[block_start:block_start + block] = block_volumes[:block].std(axis=1, ddof=1)
+        area_mean[block_start:block_start + block] = block_areas[:block].mean(axis=1)
+    return AssimilationResult(mean, spread, area_mean, innovations,
+                              Checkpoint(start + months - 1, volumes, areas))
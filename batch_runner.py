@@ -0,0 +1,127 @@
+"""
+Runs the Lake George pipeline for many lakes at once.
+
+Every csv file with the columns of lake_george_data.csv is read, summarised and modelled
+in a process pool, and the results are collected into one summary table. A file that
+fails is reported in the table's error column without stopping the other files.
+
+Run as a script, e.g. python batch_runner.py data/ --workers 8 --output summary.csv
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+import traceback
+
+import pandas as pd
+
+import model
+
+SUMMARY_COLUMNS = ['file', 'rows', 'largest_area', 'average_volume', 'most_average_rainfall', 'hottest_month',
+                   'simple_model_error', 'complex_model_error', 'seconds', 'error']
+
+
+def find_datasets(source):
+    """
+    Lists the csv files of a directory or glob pattern
+    Parameters
+    ----------
+    source : [str] - directory (all its .csv files) or glob pattern like 'data/*/lake_*.csv'
+    Returns
+    -------
+    sorted list of str paths
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, '*.csv')
+    return sorted(glob.glob(source))
+
+
+def run_file(filepath, evaporation_rate=55, cache_dir=None):
+    """
+    Reads one dataset, computes its statistics, runs both models and evaluates them
+    Parameters
+    ----------
+    filepath : [str] - path of csv file
+    evaporation_rate : [int or float] - evaporation rate of the simple model
+    cache_dir : [str] - optional directory of cached datasets, see read_dataset
+    Returns
+    -------
+    dict with a value for every name of SUMMARY_COLUMNS
+    """
+    started = time.perf_counter()
+    data = model.read_dataset(filepath, cache_dir=cache_dir)
+    summary = {
+        'file': filepath,
+        'rows': len(data.index),
+        'largest_area': model.largest_area(data),
+        'average_volume': model.average_volume(data),
+        'most_average_rainfall': model.most_average_rainfall(data),
+        'hottest_month': model.hottest_month(data),
+        'simple_model_error': model.evaluate_model(data, model.lake_george_simple_model(data, evaporation_rate)),
+        'complex_model_error': model.evaluate_model(data, model.lake_george_complex_model(data)),
+        'error': None,
+    }
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def run_batch(source, workers=None, evaporation_rate=55, cache_dir=None):
+    """
+    Runs run_file for every dataset of source in a process pool
+    Parameters
+    ----------
+    source : [str or [str]] - directory or glob pattern (see find_datasets), or a list of file paths
+    workers : [int] - number of worker processes, os.cpu_count() if None, 1 runs in this process
+    evaporation_rate : [int or float] - evaporation rate of the simple model
+    cache_dir : [str] - optional directory of cached datasets, see read_dataset
+    Returns
+    -------
+    pandas DataFrame with a row per file in SUMMARY_COLUMNS, failed files have only file and error
+    """
+    paths = find_datasets(source) if isinstance(source, str) else list(source)
+    summaries = []
+    if workers == 1:
+        for path in paths:
+            try:
+                summaries.append(run_file(path, evaporation_rate, cache_dir))
+            except Exception:
+                summaries.append(_failure(path))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_file, path, evaporation_rate, cache_dir): path for path in paths}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception:
+                    summaries.append(_failure(futures[future]))
+    summary = pd.DataFrame(summaries, columns=SUMMARY_COLUMNS)
+    return summary.sort_values('file', kind='stable').reset_index(drop=True)
+
+
+def _failure(filepath):
+    """Summary row of a file whose run raised the exception being handled."""
+    error = traceback.format_exc().strip().splitlines()[-1]
+    return {'file': filepath, 'error': error}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='directory of csv files or glob pattern')
+    parser.add_argument('--workers', type=int, help='number of worker processes, all cores if not given')
+    parser.add_argument('--evaporation-rate', type=float, default=55, help='evaporation rate of the simple model')
+    parser.add_argument('--cache-dir', help='directory of cached datasets')
+    parser.add_argument('--output', help='csv file to write the summary to, printed if not given')
+    args = parser.parse_args(argv)
+    summary = run_batch(args.source, args.workers, args.evaporation_rate, args.cache_dir)
+    if args.output:
+        summary.to_csv(args.output, index=False)
+    else:
+        print(summary.to_string(index=False))
+    return 1 if summary['error'].notnull().any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,190 @@
+"""
+Benchmarks of the public functions of model.py on synthetic Lake George shaped datasets.
+
+Run as a script, e.g. python benchmarks.py --sizes 348 100000 10000000 --output benchmarks.json
+Every function is timed (best of --repeat runs) and run once more under tracemalloc for its
+peak memory. Results are written as JSON with the commit they were measured on, and
+--compare prints the change against an earlier results file. Only the script prints, the
+functions return their results.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import model
+from model_helpers import area_table, volume_to_area
+
+DEFAULT_SIZES = [348, 10000, 100000]
+
+# lookup table of the table-accelerated volume_to_area benchmark, built once
+AREA_TABLE = area_table()
+
+# function name -> function(data, csv_path) running it on a dataset
+BENCHMARKS = {
+    'read_dataset': lambda data, path: model.read_dataset(path),
+    'check_data_validity': lambda data, path: model.check_data_validity(data),
+    'largest_area': lambda data, path: model.largest_area(data),
+    'average_volume': lambda data, path: model.average_volume(data),
+    'most_average_rainfall': lambda data, path: model.most_average_rainfall(data),
+    'hottest_month': lambda data, path: model.hottest_month(data),
+    'lake_george_simple_model': lambda data, path: model.lake_george_simple_model(data, 55),
+    'lake_george_complex_model': lambda data, path: model.lake_george_complex_model(data),
+    'evaluate_model': lambda data, path: model.evaluate_model(data, data.volume.to_numpy()),
+    'volume_to_area': lambda data, path: volume_to_area(data.volume.to_numpy()),
+    'volume_to_area_table': lambda data, path: volume_to_area(data.volume.to_numpy(), AREA_TABLE),
+}
+
+# functions given the raw (unvalidated) dataset, the others get the validated one
+RAW_INPUT = {'read_dataset', 'check_data_validity'}
+
+
+def synthetic_dataset(rows, invalid_fraction=0.01, seed=0):
+    """
+    Makes a dataset with the columns of lake_george_data.csv, dates repeat Jan 1990 to Dec 2018
+    like stacked records of many sites
+    Parameters
+    ----------
+    rows : [int] - number of months
+    invalid_fraction : [float] - fraction of values made missing or negative, for check_data_validity to impute
+    seed : [int] - seed of the random values
+    Returns
+    -------
+    pandas DataFrame with date as str, like pd.read_csv(..., dtype={'date': str})
+    """
+    rng = np.random.default_rng(seed)
+    month = np.arange(rows) % 348
+    season = np.cos(2 * np.pi * (month % 12) / 12)
+    # volume follows a bounded random walk, area is derived from it
+    steps = rng.normal(0, 3e9, rows)
+    volume = np.clip(1e11 + np.cumsum(steps - steps.mean()), 0, 2.2e11)
+    data = pd.DataFrame({
+        'date': ((1990 + month // 12) * 100 + month % 12 + 1).astype(str),
+        'volume': np.round(volume, 2),
+        'area': np.round(volume_to_area(volume), 2),
+        'solar_exposure': np.round(17 + 7 * season + rng.normal(0, 1.5, rows), 1),
+        'rainfall': np.round(rng.gamma(1.5, 35, rows), 1),
+        'max_temperature': np.round(20 + 6 * season + rng.normal(0, 1, rows), 2),
+        'min_temperature': np.round(6 + 5 * season + rng.normal(0, 1, rows), 2),
+        'humidity': np.round(47 - 8 * season + rng.normal(0, 3, rows)),
+        'wind_speed': np.round(np.abs(1.27 + rng.normal(0, 0.2, rows)), 2),
+    })
+    for column in data.columns[1:]:
+        invalid = rng.random(rows) < invalid_fraction
+        values = data[column].to_numpy(copy=True)
+        values[invalid] = np.where(rng.random(np.count_nonzero(invalid)) < 0.5, np.nan, -values[invalid])
+        data[column] = values
+    return data
+
+
+def run_benchmarks(sizes=None, functions=None, repeat=3, seed=0):
+    """
+    Times functions of model.py on synthetic datasets of every size
+    Parameters
+    ----------
+    sizes : [int] - numbers of rows, DEFAULT_SIZES if None
+    functions : [str] - names in BENCHMARKS, all if None
+    repeat : [int] - timed runs of every function, the fastest is kept
+    seed : [int] - seed of the synthetic datasets
+    Returns
+    -------
+    list of dict - function, rows, seconds, rows_per_second and peak_memory_bytes of every run
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes or DEFAULT_SIZES:
+            raw = synthetic_dataset(rows, seed=seed)
+            path = os.path.join(directory, 'data_{}.csv'.format(rows))
+            raw.to_csv(path, index=False)
+            validated = model.check_data_validity(raw.copy())
+            for name in functions or BENCHMARKS:
+                source = raw if name in RAW_INPUT else validated
+                seconds = min(_run(BENCHMARKS[name], source.copy(), path) for _ in range(repeat))
+                # the copy is made before tracing, so only memory the function allocates is counted
+                data = source.copy()
+                tracemalloc.start()
+                _run(BENCHMARKS[name], data, path)
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del data
+                results.append({'function': name, 'rows': rows, 'seconds': seconds,
+                                'rows_per_second': rows / seconds if seconds else None,
+                                'peak_memory_bytes': peak_memory})
+    return results
+
+
+def compare(results, previous):
+    """
+    Computes time and peak memory of results relative to previous results of the same function and size
+    Parameters
+    ----------
+    results : [dict] - like run_benchmarks
+    previous : [dict] - earlier results
+    Returns
+    -------
+    list of dict - function, rows, time_ratio and memory_ratio of every result with an earlier result
+    """
+    before = {(result['function'], result['rows']): result for result in previous}
+    changes = []
+    for result in results:
+        old = before.get((result['function'], result['rows']))
+        if old is None:
+            continue
+        changes.append({'function': result['function'], 'rows': result['rows'],
+                        'time_ratio': result['seconds'] / old['seconds'],
+                        'memory_ratio': result['peak_memory_bytes'] / max(old['peak_memory_bytes'], 1)})
+    return changes
+
+
+def _run(function, data, path):
+    """Runs function once on data, a copy it may change, and returns the seconds it took."""
+    started = time.perf_counter()
+    function(data, path)
+    return time.perf_counter() - started
+
+
+def _commit():
+    """Commit of the working directory, None outside git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of rows')
+    parser.add_argument('--functions', nargs='+', choices=sorted(BENCHMARKS),
+                        help='functions to time, all if not given')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of every function')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic datasets')
+    parser.add_argument('--output', default='benchmarks.json', help='JSON file to write results to')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.sizes, args.functions, args.repeat, args.seed)
+    for result in results:
+        print('{:<28}{:>12} rows {:>12.6f} s'.format(result['function'], result['rows'], result['seconds']))
+    report = {'commit': _commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': platform.python_version(),
+              'numpy': np.__version__, 'pandas': pd.__version__, 'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            changes = compare(results, json.load(file)['results'])
+        for change in changes:
+            print('{:<28}{:>12} rows  time x{:.2f}  memory x{:.2f}'.format(
+                change['function'], change['rows'], change['time_ratio'], change['memory_ratio']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,177 @@
+"""
+Calibration of the complex model's evaporation coefficients and catchment area.
+
+The coefficients of any linear evaporation formula can be searched, by default those of
+COMPLEX_EVAPORATION_FORMULA.
+
+Candidate parameters are searched with the cross-entropy method: every generation samples
+a population around the current mean, scores it against data.volume and moves the mean to
+the best candidates. Generations are scored in chunks across a process pool, each chunk as
+one lake_george_batch_model run, and already scored candidates are taken from a cache.
+"""
+
+import collections
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+
+from evaporation import linear_formula
+from model import COMPLEX_EVAPORATION_FORMULA, largest_area, lake_george_batch_model
+
+# best parameters found (coefficients in the order of the formula's columns, and the formula with them), loss of
+# every generation's best candidate and number of models run
+CalibrationResult = collections.namedtuple(
+    'CalibrationResult', ['coefficients', 'catchment_area', 'loss', 'trace', 'evaluations', 'formula'])
+
+# decimals candidates are rounded to, so that nearly equal candidates share a cache entry
+CACHE_DECIMALS = 6
+
+# smallest starting spread of a coefficient, so coefficients starting at 0 are searched too
+MIN_SPREAD = 0.1
+
+_worker_data = None
+_worker_loss = None
+_worker_columns = None
+_worker_intercept = None
+
+
+def calibrate_complex_model(data, loss=None, workers=None, time_budget=None, generations=50, population=32,
+                            fit_catchment_area=True, seed=None, formula=COMPLEX_EVAPORATION_FORMULA):
+    """
+    Searches evaporation coefficients (and catchment area) of the complex model minimising loss against data.volume
+    Parameters
+    ----------
+    data : [pandas DataFrame]
+        dataframe consisting all data from csv file
+    loss : [function] - loss(data, volumes) like evaluate_model, must be picklable (a module level function).
+        Mean absolute error (evaluate_model) if None
+    workers : [int] - number of worker processes, os.cpu_count() if None, 1 scores in this process
+    time_budget : [float] - seconds after which no new generation is started, no limit if None
+    generations : [int] - largest number of generations, at least 1
+    population : [int] - candidates sampled every generation
+    fit_catchment_area : [bool] - also fit catchment area, as a multiple of largest_area(data)
+    seed : [int] - seed of the random candidates, for reproducible calibrations
+    formula : [EvaporationFormula] - linear evaporation formula whose coefficients are searched, starting from them
+    Returns
+    -------
+    CalibrationResult - best coefficients, catchment area and loss, best loss of every generation (trace),
+    number of models run (evaluations) and the formula with the best coefficients
+    Raises ValueError if formula is not linear or generations is below 1
+    """
+    if formula.coefficients is None:
+        raise ValueError("only the coefficients of a linear formula can be calibrated")
+    if generations < 1:
+        raise ValueError("calibration needs at least 1 generation but was given {}".format(generations))
+    started = time.monotonic()
+    rng = np.random.default_rng(seed)
+    workers = workers or os.cpu_count() or 1
+    start = np.array(list(formula.coefficients.values()), dtype=float)
+    mean = np.append(start, 1.0)
+    spread = np.append(np.maximum(np.abs(start) * 0.5, MIN_SPREAD), 0.2 if fit_catchment_area else 0)
+    elite_count = max(2, population // 4)
+    cache = {}
+    trace = []
+    executor = None
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(data, loss, formula.columns, formula.intercept))
+    try:
+        for generation in range(generations):
+            if time_budget is not None and generation > 0 and time.monotonic() - started > time_budget:
+                break
+            candidates = mean + spread * rng.standard_normal((population, len(mean)))
+            # catchment area must stay positive
+            candidates[:, -1] = np.abs(candidates[:, -1])
+            if trace:
+                candidates[0] = best
+            candidates = np.round(candidates, CACHE_DECIMALS)
+            losses = _score(data, loss, formula.columns, formula.intercept, candidates, cache, executor, workers)
+            order = np.argsort(losses)
+            if not trace or losses[order[0]] < trace[-1]:
+                best = candidates[order[0]]
+                trace.append(float(losses[order[0]]))
+            else:
+                trace.append(trace[-1])
+            elite = candidates[order[:elite_count]]
+            mean = elite.mean(axis=0)
+            spread = 0.7 * spread + 0.3 * elite.std(axis=0)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    coefficients = tuple(float(coefficient) for coefficient in best[:-1])
+    return CalibrationResult(coefficients, float(best[-1] * largest_area(data)), trace[-1], trace, len(cache),
+                             linear_formula(zip(formula.columns, coefficients), formula.intercept))
+
+
+def _score(data, loss, columns, intercept, candidates, cache, executor, workers):
+    """
+    Scores candidates, only the ones not in cache are run
+    Parameters
+    ----------
+    data : [pandas DataFrame]
+        dataframe consisting all data from csv file
+    loss : [function] - loss(data, volumes), mean absolute error if None
+    columns : [str] - columns of the linear formula the coefficients are of
+    intercept : [float] - intercept of the formula
+    candidates : [numpy array] - (candidates, columns + 1) coefficients and catchment area multiple
+    cache : [dict] - tuple of candidate -> loss, updated with the new losses
+    executor : [ProcessPoolExecutor] - pool scoring chunks of candidates, scored in this process if None
+    workers : [int] - number of chunks to split new candidates into
+    Returns
+    -------
+    numpy array of float - loss of every candidate
+    """
+    keys = [tuple(candidate) for candidate in candidates]
+    new_keys = list(dict.fromkeys(key for key in keys if key not in cache))
+    if new_keys:
+        chunks = np.array_split(np.array(new_keys), min(workers, len(new_keys)))
+        if executor is None:
+            losses = [_evaluate_candidates(data, loss, columns, intercept, chunk) for chunk in chunks]
+        else:
+            losses = executor.map(_evaluate_in_worker, chunks)
+        cache.update(zip(new_keys, np.concatenate(list(losses))))
+    return np.array([cache[key] for key in keys])
+
+
+def _evaluate_candidates(data, loss, columns, intercept, candidates):
+    """
+    Runs the complex model for every candidate as one batch and scores each run
+    Parameters
+    ----------
+    data : [pandas DataFrame]
+        dataframe consisting all data from csv file
+    loss : [function] - loss(data, volumes), mean absolute error if None
+    columns : [str] - columns of the linear formula the coefficients are of
+    intercept : [float] - intercept of the formula
+    candidates : [numpy array] - (candidates, columns + 1) coefficients and catchment area multiple
+    Returns
+    -------
+    numpy array of float - loss of every candidate, inf if the model run is not finite
+    """
+    # one formula with a column of coefficients per candidate gives (candidates, months) rates
+    coefficients = candidates[:, :-1].T[:, :, np.newaxis]
+    formula = linear_formula(zip(columns, coefficients), intercept)
+    rates = formula.function({column: np.asarray(data[column], dtype=float) for column in columns})
+    with np.errstate(all='ignore'):
+        volumes = lake_george_batch_model(data, rates, catchment_areas=candidates[:, -1] * largest_area(data))
+        if loss is None:
+            losses = np.mean(np.abs(np.asarray(data.volume, dtype=float) - volumes), axis=1)
+        else:
+            losses = np.array([loss(data, row) for row in volumes], dtype=float)
+    return np.where(np.isfinite(losses), losses, np.inf)
+
+
+def _init_worker(data, loss, columns, intercept):
+    """Keeps data, loss and the formula's columns and intercept in a worker process so they are sent once."""
+    global _worker_data, _worker_loss, _worker_columns, _worker_intercept
+    _worker_data = data
+    _worker_loss = loss
+    _worker_columns = columns
+    _worker_intercept = intercept
+
+
+def _evaluate_in_worker(candidates):
+    """_evaluate_candidates with the data and loss of this worker process."""
+    return _evaluate_candidates(_worker_data, _worker_loss, _worker_columns, _worker_intercept, candidates)
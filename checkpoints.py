@@ -0,0 +1,74 @@
+"""
+Checkpoints of Lake George simulations.
+
+The models only carry the previous month's volume and surface area from one month to the
+next, so that state is all a simulation needs to resume from a month with the same
+results as a replay from the first month. Checkpoints are kept in memory as Checkpoint
+tuples or saved to compact .npz files.
+"""
+
+import collections
+import os
+
+import numpy as np
+
+# month is the position in data of the month whose end state is kept, volume and surface_area are
+# floats for one simulation or numpy arrays with one value per scenario
+Checkpoint = collections.namedtuple('Checkpoint', ['month', 'volume', 'surface_area'])
+
+
+def save_checkpoint(checkpoint, path):
+    """
+    Saves a checkpoint to a .npz file
+    Parameters
+    ----------
+    checkpoint : [Checkpoint] - state to save
+    path : [str] - path of the file, ending in .npz
+    """
+    save_arrays(path, month=checkpoint.month, volume=checkpoint.volume, surface_area=checkpoint.surface_area)
+
+
+def save_arrays(path, **arrays):
+    """
+    Saves arrays to a .npz file, replacing the file in one step so an interrupted save leaves the
+    previous file readable
+    Parameters
+    ----------
+    path : [str] - path of the file, ending in .npz
+    arrays : [numpy array] - arrays to save, by name
+    """
+    temporary = str(path) + '.tmp.npz'
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint saved by save_checkpoint
+    Parameters
+    ----------
+    path : [str] - path of the file
+    Returns
+    -------
+    Checkpoint, with floats for a single simulation
+    """
+    with np.load(path) as saved:
+        volume = saved['volume']
+        surface_area = saved['surface_area']
+        return Checkpoint(int(saved['month']), float(volume) if volume.ndim == 0 else volume,
+                          float(surface_area) if surface_area.ndim == 0 else surface_area)
+
+
+def checkpoint_saver(path):
+    """
+    Makes an on_checkpoint function saving every checkpoint to path, keeping only the latest
+    Parameters
+    ----------
+    path : [str] - path of the file, ending in .npz
+    Returns
+    -------
+    function(checkpoint)
+    """
+    def save(checkpoint):
+        save_checkpoint(checkpoint, path)
+    return save
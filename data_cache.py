@@ -0,0 +1,114 @@
+"""
+Binary column cache of validated datasets, used by model.read_dataset.
+
+A cached dataset is a directory holding one .npy file per column and a meta.json with
+the column order, the SHA-256 of the source csv file and the validation rule version.
+Columns are memory mapped copy-on-write when loaded, so nothing is parsed or copied, and
+changing a loaded frame never changes the cache. A cache whose source hash or version
+differs from the current ones is stale and is rebuilt by read_dataset.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+
+
+def cache_path(filepath, cache_dir):
+    """
+    Directory of the cached dataset of a csv file
+    Parameters
+    ----------
+    filepath : [str] - path of csv file
+    cache_dir : [str] - directory holding cached datasets
+    Returns
+    -------
+    str path of the cache directory of filepath
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    # the absolute path keeps equally named files of different directories apart
+    digest = hashlib.sha256(os.path.abspath(filepath).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, '{}-{}'.format(name, digest))
+
+
+def file_hash(filepath):
+    """
+    SHA-256 of a file's content
+    Parameters
+    ----------
+    filepath : [str] - path of file
+    Returns
+    -------
+    str hex digest
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cache(filepath, cache_dir, version):
+    """
+    Loads the cached dataset of a csv file if it is up to date
+    Parameters
+    ----------
+    filepath : [str] - path of csv file
+    cache_dir : [str] - directory holding cached datasets
+    version : [int] - version of the validation rules the cache must be made with
+    Returns
+    -------
+    pandas DataFrame with memory mapped columns, None if there is no cache or it is stale
+    """
+    path = cache_path(filepath, cache_dir)
+    try:
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != version or meta.get('source_hash') != file_hash(filepath):
+        return None
+    columns = {column: np.load(os.path.join(path, '{}.npy'.format(index)), mmap_mode='c')
+               for index, column in enumerate(meta['columns'])}
+    data_frame = pd.DataFrame(columns, copy=False)
+    for column in meta['string_columns']:
+        data_frame[column] = data_frame[column].astype(str)
+    return data_frame
+
+
+def write_cache(data_frame, filepath, cache_dir, version):
+    """
+    Writes a validated dataset as the cache of a csv file, replacing any older cache
+    Parameters
+    ----------
+    data_frame : [pandas DataFrame] - validated dataset read from filepath
+    filepath : [str] - path of csv file
+    cache_dir : [str] - directory holding cached datasets
+    version : [int] - version of the validation rules data_frame was made with
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(filepath, cache_dir)
+    # written to a new directory first so readers never see a half written cache
+    new_path = tempfile.mkdtemp(dir=cache_dir)
+    string_columns = []
+    for index, column in enumerate(data_frame.columns):
+        values = data_frame[column]
+        if values.dtype.kind in 'biuf':
+            values = values.to_numpy()
+        else:
+            string_columns.append(column)
+            values = values.to_numpy(dtype=str)
+        np.save(os.path.join(new_path, '{}.npy'.format(index)), values)
+    meta = {'source': os.path.abspath(filepath), 'source_hash': file_hash(filepath), 'version': version,
+            'columns': list(data_frame.columns), 'string_columns': string_columns}
+    with open(os.path.join(new_path, META_FILE), 'w') as file:
+        json.dump(meta, file)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(new_path, path)
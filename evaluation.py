@@ -0,0 +1,211 @@
+"""
+Scoring of predicted volumes against the recorded volumes of the data.
+
+Predictions are a (predictions, months) matrix, like lake_george_batch_model returns, or a
+single list of volumes. Every metric is a reduction over months of the whole matrix:
+mae (mean absolute error), rmse (root mean squared error), bias (mean of predicted minus
+recorded), nse (Nash-Sutcliffe efficiency) and kge (Kling-Gupta efficiency). Scores can be
+split by period (month, year, season), over rolling windows or at a hold-out month.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lake_statistics import group_keys
+from periods import select, select_months, time_slice
+
+METRICS = ('mae', 'rmse', 'bias', 'nse', 'kge')
+
+
+def score(observed, predicted, metrics=METRICS):
+    """
+    Scores predictions against observed volumes
+    Parameters
+    ----------
+    observed : [float] - recorded volume of every month
+    predicted : [float or [[float]]] - volumes of one prediction (months,) or many (predictions, months)
+    metrics : [str] - names of METRICS to compute
+    Returns
+    -------
+    dict of metric -> float for one prediction, numpy array of one score per prediction for many
+    """
+    observed, predicted, single = _as_matrix(observed, predicted)
+    sums = _sums(observed, predicted, axis=-1)
+    return _squeeze(_metrics(sums, metrics), single)
+
+
+def evaluate(data, predictions, metrics=METRICS, start=None, end=None):
+    """
+    Scores predictions against data.volume, evaluate_model's mae for many predictions and metrics
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    predictions : [float or [[float]]] - volumes of one prediction (months,) or many (predictions, months)
+    metrics : [str] - names of METRICS to compute
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+        predictions may be given for every month of data or only for these months
+    Returns
+    -------
+    dict of metric -> score, see score
+    """
+    predictions = select_months(predictions, data, start, end)
+    data = select(data, start, end)
+    return score(np.asarray(data.volume, dtype=float), predictions, metrics)
+
+
+def period_scores(data, predictions, by='year', metrics=METRICS, start=None, end=None):
+    """
+    Scores predictions separately for every period
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    predictions : [float or [[float]]] - volumes of one prediction (months,) or many (predictions, months)
+    by : [str] - 'month', 'year' or 'season'
+    metrics : [str] - names of METRICS to compute
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+        predictions may be given for every month of data or only for these months
+    Returns
+    -------
+    dict of metric -> pandas DataFrame with a row per period and a column per prediction
+    """
+    predictions = select_months(predictions, data, start, end)
+    data = select(data, start, end)
+    observed, predicted, single = _as_matrix(np.asarray(data.volume, dtype=float), predictions)
+    periods, period_index = np.unique(group_keys(data, by), return_inverse=True)
+    # one-hot membership of every month, so every period's sums are one matrix product
+    membership = np.zeros((len(period_index), len(periods)))
+    membership[np.arange(len(period_index)), period_index] = 1
+    sums = _sums(observed, predicted, membership=membership)
+    index = pd.Index(periods, name=by)
+    return {metric: pd.DataFrame(values.T, index=index) for metric, values in _metrics(sums, metrics).items()}
+
+
+def rolling_scores(data, predictions, window, metrics=METRICS, start=None, end=None):
+    """
+    Scores predictions over every window of consecutive months
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    predictions : [float or [[float]]] - volumes of one prediction (months,) or many (predictions, months)
+    window : [int] - months per window
+    metrics : [str] - names of METRICS to compute
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+        predictions may be given for every month of data or only for these months
+    Returns
+    -------
+    dict of metric -> numpy array (windows,) for one prediction or (predictions, windows) for many,
+    window k covers months k to k + window - 1
+    """
+    predictions = select_months(predictions, data, start, end)
+    data = select(data, start, end)
+    observed, predicted, single = _as_matrix(np.asarray(data.volume, dtype=float), predictions)
+    sums = _sums(observed, predicted, window=window)
+    return _squeeze(_metrics(sums, metrics), single)
+
+
+def holdout_scores(data, predictions, split, metrics=METRICS):
+    """
+    Scores predictions before and from a hold-out month
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    predictions : [float or [[float]]] - volumes of one prediction (months,) or many (predictions, months)
+    split : [int or str] - position of the first hold-out month, or its month like '2010-01', see periods.select
+    metrics : [str] - names of METRICS to compute
+    Returns
+    -------
+    dict with 'calibration' and 'validation' scores, see score
+    """
+    observed, predicted, single = _as_matrix(np.asarray(data.volume, dtype=float), predictions)
+    if isinstance(split, str):
+        split = time_slice(data, start=split).start
+    return {'calibration': _squeeze(_metrics(_sums(observed[:split], predicted[:, :split], axis=-1), metrics),
+                                    single),
+            'validation': _squeeze(_metrics(_sums(observed[split:], predicted[:, split:], axis=-1), metrics),
+                                   single)}
+
+
+def _as_matrix(observed, predicted):
+    """Observed volumes as floats and predictions as a (predictions, months) matrix cut to observed months."""
+    observed = np.asarray(observed, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    single = predicted.ndim == 1
+    predicted = np.atleast_2d(predicted)[:, :len(observed)]
+    return observed, predicted, single
+
+
+def _sums(observed, predicted, axis=None, membership=None, window=None):
+    """
+    Sums the metrics are computed from, over all months (axis), per period (membership) or per window
+    Volumes are shifted by the mean observed volume first, which keeps sums of squares accurate.
+    Returns
+    -------
+    dict of count, shift and sums of absolute error, error, squared error, observed, predicted, their squares
+    and product
+    """
+    shift = observed.mean() if len(observed) else 0.0
+    observed = observed - shift
+    predicted = predicted - shift
+    error = predicted - observed
+    terms = {'abs_error': np.abs(error), 'error': error, 'squared_error': error ** 2,
+             'observed': np.broadcast_to(observed, predicted.shape), 'predicted': predicted,
+             'observed_squared': np.broadcast_to(observed ** 2, predicted.shape), 'predicted_squared': predicted ** 2,
+             'product': predicted * observed}
+    if membership is not None:
+        sums = {name: values @ membership for name, values in terms.items()}
+        sums['count'] = membership.sum(axis=0)
+    elif window is not None:
+        sums = {}
+        for name, values in terms.items():
+            cumulative = np.concatenate((np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)), axis=-1)
+            sums[name] = cumulative[..., window:] - cumulative[..., :-window]
+        sums['count'] = float(window)
+    else:
+        sums = {name: values.sum(axis=axis) for name, values in terms.items()}
+        sums['count'] = float(observed.shape[-1])
+    sums['shift'] = shift
+    return sums
+
+
+def _metrics(sums, metrics):
+    """Computes metrics from _sums, undefined scores (like nse of a constant record) are nan."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = sums['count']
+        observed_mean = sums['observed'] / count
+        predicted_mean = sums['predicted'] / count
+        observed_variance = np.maximum(sums['observed_squared'] / count - observed_mean ** 2, 0)
+        predicted_variance = np.maximum(sums['predicted_squared'] / count - predicted_mean ** 2, 0)
+        covariance = sums['product'] / count - observed_mean * predicted_mean
+        result = {}
+        for metric in metrics:
+            if metric == 'mae':
+                result[metric] = sums['abs_error'] / count
+            elif metric == 'rmse':
+                result[metric] = np.sqrt(sums['squared_error'] / count)
+            elif metric == 'bias':
+                result[metric] = sums['error'] / count
+            elif metric == 'nse':
+                result[metric] = 1 - sums['squared_error'] / (observed_variance * count)
+            elif metric == 'kge':
+                correlation = covariance / np.sqrt(observed_variance * predicted_variance)
+                variability = np.sqrt(predicted_variance / observed_variance)
+                # ratio of the unshifted means
+                mean_ratio = (predicted_mean + sums['shift']) / (observed_mean + sums['shift'])
+                result[metric] = 1 - np.sqrt((correlation - 1) ** 2 + (variability - 1) ** 2 + (mean_ratio - 1) ** 2)
+            else:
+                raise ValueError("metric should be one of {} but is {!r}".format(METRICS, metric))
+    return result
+
+
+def _squeeze(scores, single):
+    """Scores of a single prediction without the predictions axis, floats for whole-record scores."""
+    if not single:
+        return scores
+    return {metric: values[0] if np.ndim(values[0]) else float(values[0]) for metric, values in scores.items()}
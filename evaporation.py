@@ -0,0 +1,146 @@
+"""
+Evaporation formulas of the lake models, declared once and evaluated over whole columns.
+
+A formula is either coefficients over named columns (linear_formula) or a small arithmetic
+expression of column names (expression_formula), like
+
+    expression_formula('1.6 * max_temperature - 3 * min_temperature - 2.5 * wind_speed'
+                       ' + 4.5 * solar_exposure - 0.4 * humidity')
+
+Expressions may use + - * / **, numbers, column names and the functions of
+EXPRESSION_FUNCTIONS. Numbers are floats, so constant arithmetic like 9 ** 9 ** 9 overflows
+instead of building an unbounded integer. Declarations are compiled into a NumPy function of the columns, and
+evaporation_rates caches the evaluated column per dataset and formula, so models only
+read a precomputed array in their monthly loop. A cached column is used while the values
+the formula reads are unchanged, which costs one comparison of those columns a call.
+"""
+
+import ast
+import collections
+import weakref
+
+import numpy as np
+
+from profiling import instrument
+
+# key identifies the formula, columns it reads, function(dict of column -> numpy array) returns the rates,
+# coefficients (column -> coefficient) and intercept of a linear formula, None for an expression
+EvaporationFormula = collections.namedtuple('EvaporationFormula', ['key', 'columns', 'function', 'coefficients',
+                                                                   'intercept'])
+
+EXPRESSION_FUNCTIONS = {'abs': np.abs, 'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt, 'maximum': np.maximum,
+                        'minimum': np.minimum}
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call, ast.Add,
+                  ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+# id(data) -> (weak reference to data, {formula key: (copies of the source columns, rates)})
+_cache = {}
+
+
+def linear_formula(coefficients, intercept=0):
+    """
+    Declares evaporation rate = intercept + sum of coefficient * column
+    Parameters
+    ----------
+    coefficients : [dict] - column name -> coefficient, added up in this order
+    intercept : [float] - constant part of the rate
+    Returns
+    -------
+    EvaporationFormula
+    """
+    coefficients = dict(coefficients)
+    columns = tuple(coefficients)
+
+    def function(values):
+        evaporation_rate = intercept
+        for column, coefficient in coefficients.items():
+            evaporation_rate = evaporation_rate + coefficient * values[column]
+        return evaporation_rate
+
+    key = ('linear', tuple(coefficients.items()), intercept)
+    return EvaporationFormula(key, columns, function, coefficients, intercept)
+
+
+def expression_formula(expression):
+    """
+    Declares evaporation rate as an arithmetic expression of column names
+    Parameters
+    ----------
+    expression : [str] - like '1.6 * max_temperature - 0.4 * humidity'
+    Returns
+    -------
+    EvaporationFormula
+    Raises ValueError if the expression uses anything but numbers, columns, arithmetic and EXPRESSION_FUNCTIONS
+    """
+    tree = ast.parse(expression, mode='eval')
+    columns = []
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError("{!r} is not allowed in an evaporation formula".format(type(node).__name__))
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ValueError("{!r} is not a number, formulas only use numbers".format(node.value))
+            try:
+                node.value = float(node.value)
+            except OverflowError:
+                raise ValueError("{} is too large for a formula".format(node.value)) from None
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in EXPRESSION_FUNCTIONS
+                                               and not node.keywords):
+            raise ValueError("only the functions {} are allowed in an evaporation formula".format(
+                sorted(EXPRESSION_FUNCTIONS)))
+        if isinstance(node, ast.Name) and node.id not in EXPRESSION_FUNCTIONS and node.id not in columns:
+            columns.append(node.id)
+    code = compile(tree, '<evaporation formula>', 'eval')
+
+    def function(values):
+        namespace = dict(EXPRESSION_FUNCTIONS)
+        namespace.update((column, values[column]) for column in columns)
+        return eval(code, {'__builtins__': {}}, namespace)
+
+    return EvaporationFormula(('expression', ast.dump(tree)), tuple(columns), function, None, None)
+
+
+@instrument()
+def evaporation_rates(data, formula):
+    """
+    Evaluates a formula over every month of data, cached per dataset and formula
+    Cached rates are used only while the formula's columns hold the values they were evaluated from, so
+    replacing a column or changing its values in place evaluates the formula again.
+    Parameters
+    ----------
+    data : [pandas DataFrame, LakeSeries or dict]
+        dataframe consisting all data from csv file, or column name -> values of every month, which is not cached
+    formula : [EvaporationFormula] - made by linear_formula or expression_formula
+    Returns
+    -------
+    read-only numpy array of float - evaporation rate of every month
+    """
+    sources = [np.asarray(data[column]) for column in formula.columns]
+    if isinstance(data, dict):
+        # a dict cannot be weakly referenced, its rates are evaluated every call
+        return _evaluate(formula, sources, len(next(iter(data.values()))))
+    reference, rates_by_formula = _cache.get(id(data), (None, None))
+    if reference is None or reference() is not data:
+        rates_by_formula = {}
+        _cache[id(data)] = (weakref.ref(data, lambda _, key=id(data): _cache.pop(key, None)), rates_by_formula)
+    cached = rates_by_formula.get(formula.key)
+    if cached is not None and all(_unchanged(copy, source) for copy, source in zip(cached[0], sources)):
+        return cached[1]
+    rates = _evaluate(formula, sources, len(data))
+    # copies, the columns of data can change in place
+    rates_by_formula[formula.key] = ([source.copy() for source in sources], rates)
+    return rates
+
+
+def _unchanged(copy, source):
+    """True if source holds the values of copy, missing values included."""
+    return np.array_equal(copy, source, equal_nan=source.dtype.kind in 'fc')
+
+
+def _evaluate(formula, sources, months):
+    """Read-only rates of every month from the arrays of the formula's columns."""
+    values = {column: source.astype(float, copy=False) for column, source in zip(formula.columns, sources)}
+    rates = np.broadcast_to(np.asarray(formula.function(values), dtype=float), (months,)).copy()
+    rates.setflags(write=False)
+    return rates
@@ -0,0 +1,325 @@
+"""
+Local what-if forecast service for Lake George.
+
+The dataset is read and validated once when the server starts, and the state at the end of
+the record (last recorded volume and surface area, catchment area, monthly climatology of
+the drivers) is kept in memory. A scenario request gives the drivers of the next months,
+or only a number of months to use the climatology, and the simple or complex model
+projects volumes from the end of the record. Results of identical requests are served
+from an LRU cache, and identical requests arriving together are computed once.
+
+Run as a script, e.g. python forecast_server.py lake_george_data.csv --port 8080, then
+
+    POST /forecast  {"months": 24, "evaporation_rate": 55}
+    POST /forecast  {"drivers": {"rainfall": [...], "max_temperature": [...], ...},
+                     "coefficients": [1.6, -3, -2.5, 4.5, -0.4]}
+    POST /forecast  {"months": 24, "formula": "1.5 * max_temperature - 0.3 * humidity"}
+    GET  /state
+
+Pass --unix-socket PATH instead of --port to listen on a Unix socket.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import threading
+
+import numpy as np
+
+from evaporation import evaporation_rates, expression_formula, linear_formula
+from lake_statistics import grouped_statistics
+from model import (COMPLEX_EVAPORATION_FORMULA, EVAPORATION_COLUMNS, date_parts, largest_area, read_dataset,
+                   simulate_volumes)
+
+# longest forecast a request may ask for, 100 years
+MAX_FORECAST_MONTHS = 1200
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class ForecastService:
+    """
+    Projects volumes of the months after the end of the record, keeping the end state in memory
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    cache_size : [int] - number of results kept in the LRU cache
+    formula : [EvaporationFormula] - evaporation formula of the complex model when a request gives none,
+        see evaporation.py
+    """
+
+    def __init__(self, data, cache_size=256, formula=COMPLEX_EVAPORATION_FORMULA):
+        years, months = date_parts(data)
+        self.last_year = int(years[-1])
+        self.last_month = int(months[-1])
+        self.volume = float(data.volume[len(data) - 1])
+        self.surface_area = float(data.area[len(data) - 1])
+        self.catchment_area = float(largest_area(data))
+        self.formula = formula
+        # columns a request can give drivers for, those of the complex model and of formula
+        self.driver_columns = list(dict.fromkeys(['rainfall'] + EVAPORATION_COLUMNS + list(formula.columns)))
+        # mean driver of every calendar month, used for the months a request gives no drivers for
+        climatology = grouped_statistics(data, 'month', self.driver_columns, ('mean',))
+        climatology.columns = climatology.columns.get_level_values(0)
+        self.climatology = climatology.reindex(range(1, 13))
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        # scenarios are projected in threads of the server, the cache is shared by them
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def forecast(self, scenario):
+        """
+        Projects volumes of a scenario, from the LRU cache if it was projected before
+        Parameters
+        ----------
+        scenario : [dict] with
+            months - number of months to project, the length of the drivers if they are given,
+            drivers - optional dict of column -> value of every month, rainfall and, for the complex model,
+                the columns of its formula. Columns not given are the climatology of their calendar months,
+            evaporation_rate - constant evaporation rate (simple model), the complex model if not given,
+            coefficients - complex model coefficients of EVAPORATION_COLUMNS,
+            formula - complex model evaporation formula, an expression of driver columns like
+                '1.6 * max_temperature - 0.4 * humidity', see evaporation.expression_formula.
+            The service's formula is used if neither coefficients nor formula are given
+        Returns
+        -------
+        dict with dates ('YYYYMM') and projected volumes of the months after the record
+        Raises ValueError if the scenario is not valid
+        """
+        key = json.dumps(scenario, sort_keys=True)
+        with self.lock:
+            if key in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            self.misses += 1
+        result = self._project(scenario)
+        with self.lock:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def state(self):
+        """
+        Describes the warm end-of-record state and the cache
+        Returns
+        -------
+        dict of last_date, volume, surface_area, catchment_area and cache size, hits and misses
+        """
+        return {'last_date': '{:04d}{:02d}'.format(self.last_year, self.last_month), 'volume': self.volume,
+                'surface_area': self.surface_area, 'catchment_area': self.catchment_area,
+                'cache': {'size': len(self.cache), 'hits': self.hits, 'misses': self.misses}}
+
+    def _project(self, scenario):
+        """Runs the model for one scenario, see forecast."""
+        if not isinstance(scenario, dict):
+            raise ValueError("scenario should be a JSON object")
+        drivers = scenario.get('drivers') or {}
+        if not isinstance(drivers, dict):
+            raise ValueError("drivers should be an object of column -> monthly values")
+        if not all(isinstance(values, list) for values in drivers.values()):
+            raise ValueError("every driver should be a list of monthly values")
+        lengths = {len(values) for values in drivers.values()}
+        if len(lengths) > 1:
+            raise ValueError("every driver should have the same number of months")
+        months = scenario.get('months', lengths.pop() if lengths else None)
+        if not isinstance(months, int) or not 0 < months <= MAX_FORECAST_MONTHS:
+            raise ValueError("months should be an integer from 1 to {}".format(MAX_FORECAST_MONTHS))
+        # calendar month (1-12) of every projected month
+        offsets = self.last_month + np.arange(months)
+        calendar_months = offsets % 12 + 1
+        years = self.last_year + offsets // 12
+        columns = {}
+        for column in self.driver_columns:
+            if column in drivers:
+                values = np.asarray(drivers[column], dtype=float)
+                if len(values) != months:
+                    raise ValueError("{} should have a value for each of the {} months".format(column, months))
+            else:
+                values = self.climatology[column].to_numpy()[calendar_months - 1]
+            columns[column] = values
+        unknown = set(drivers) - set(columns)
+        if unknown:
+            raise ValueError("unknown drivers {}".format(sorted(unknown)))
+        evaporation_rate = scenario.get('evaporation_rate')
+        if evaporation_rate is None:
+            rates = evaporation_rates(columns, self._formula(scenario))
+        else:
+            rates = np.full(months, float(evaporation_rate))
+        # the first simulated month is the end of the record, the projection starts after it
+        volumes = simulate_volumes(np.append(0.0, columns['rainfall']), np.append(0.0, rates)[np.newaxis, :],
+                                   self.catchment_area, self.volume, self.surface_area)[0, 1:]
+        if not np.all(np.isfinite(volumes)):
+            raise ValueError("drivers should be finite, the climatology has no value for some calendar months")
+        dates = ['{:04d}{:02d}'.format(year, month) for year, month in zip(years, calendar_months)]
+        return {'dates': dates, 'volumes': volumes.tolist()}
+
+    def _formula(self, scenario):
+        """Evaporation formula of a scenario's coefficients or formula, see forecast."""
+        if 'formula' in scenario:
+            if not isinstance(scenario['formula'], str):
+                raise ValueError("formula should be an expression of driver columns")
+            try:
+                formula = expression_formula(scenario['formula'])
+            except SyntaxError as error:
+                raise ValueError("formula is not a valid expression: {}".format(error.msg)) from None
+            unknown = set(formula.columns) - set(self.driver_columns)
+            if unknown:
+                raise ValueError("formula uses unknown drivers {}".format(sorted(unknown)))
+            return formula
+        if 'coefficients' not in scenario:
+            return self.formula
+        coefficients = scenario['coefficients']
+        if not isinstance(coefficients, (list, tuple)) or len(coefficients) != len(EVAPORATION_COLUMNS):
+            raise ValueError("coefficients should have one value for each of {}".format(EVAPORATION_COLUMNS))
+        return linear_formula(zip(EVAPORATION_COLUMNS, [float(coefficient) for coefficient in coefficients]))
+
+
+class ForecastServer:
+    """
+    Serves a ForecastService over HTTP/1.1 with asyncio, scenarios are projected in a thread
+    so the event loop keeps accepting requests
+    Parameters
+    ----------
+    service : [ForecastService] - warm state and result cache
+    """
+
+    def __init__(self, service):
+        self.service = service
+        # key of a scenario being projected -> its future, so identical requests are projected once
+        self.pending = {}
+
+    async def handle_connection(self, reader, writer):
+        """Answers the requests of one connection until the client closes it."""
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError:
+                    _write_response(writer, 400, {'error': 'malformed HTTP request'}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                status, payload = await self.respond(method, path, body)
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, body):
+        """
+        Computes the response of one request
+        Returns
+        -------
+        (HTTP status, JSON payload)
+        """
+        if path == '/state':
+            if method != 'GET':
+                return 405, {'error': 'use GET /state'}
+            return 200, self.service.state()
+        if path != '/forecast':
+            return 404, {'error': 'unknown path {}, use POST /forecast or GET /state'.format(path)}
+        if method != 'POST':
+            return 405, {'error': 'use POST /forecast'}
+        try:
+            scenario = json.loads(body or b'{}')
+            return 200, await self.forecast(scenario)
+        except (ValueError, TypeError, ArithmeticError) as error:
+            # invalid scenarios, and numbers out of range like an evaporation rate of 10 ** 400
+            return 400, {'error': str(error)}
+        except Exception as error:
+            return 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+
+    async def forecast(self, scenario):
+        """Projects a scenario in a worker thread, joining a projection of the same scenario already running."""
+        key = json.dumps(scenario, sort_keys=True)
+        if key in self.service.cache:
+            # cached results are answered without a thread
+            return self.service.forecast(scenario)
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, self.service.forecast, scenario)
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        return await asyncio.shield(future)
+
+
+async def serve(service, host='127.0.0.1', port=8080, unix_socket=None):
+    """
+    Starts serving a ForecastService
+    Parameters
+    ----------
+    service : [ForecastService] - warm state and result cache
+    host : [str] - address to listen on
+    port : [int] - TCP port, 0 picks a free port
+    unix_socket : [str] - path of a Unix socket to listen on instead of host and port
+    Returns
+    -------
+    asyncio Server, started
+    """
+    server = ForecastServer(service)
+    if unix_socket is not None:
+        return await asyncio.start_unix_server(server.handle_connection, path=unix_socket)
+    return await asyncio.start_server(server.handle_connection, host, port)
+
+
+async def _read_request(reader):
+    """Reads one HTTP request, returns (method, path, body, keep_alive) or None at end of stream."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, version = line.decode('latin-1').split(None, 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version.strip() == 'HTTP/1.1' else connection == 'keep-alive'
+    return method.upper(), path.split('?')[0], body, keep_alive
+
+
+def _write_response(writer, status, payload, keep_alive):
+    """Writes a JSON response."""
+    body = json.dumps(payload).encode()
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+        status, REASONS[status], len(body), 'keep-alive' if keep_alive else 'close')
+    writer.write(head.encode('latin-1') + body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filepath', help='csv file of the lake')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='TCP port to listen on')
+    parser.add_argument('--unix-socket', help='Unix socket to listen on instead of a TCP port')
+    parser.add_argument('--cache-dir', help='directory of cached datasets, see read_dataset')
+    parser.add_argument('--cache-size', type=int, default=256, help='number of results kept in the LRU cache')
+    args = parser.parse_args(argv)
+    service = ForecastService(read_dataset(args.filepath, cache_dir=args.cache_dir), args.cache_size)
+
+    async def run():
+        server = await serve(service, args.host, args.port, args.unix_socket)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,265 @@
+"""
+Append-only Lake George dataset with summary statistics kept up to date.
+
+Months are appended one at a time, like the rows monthly_rows streams from a station log.
+Every append updates running aggregates: the largest area, the mean volume (Welford's
+update), the sum and count of max_temperature of each calendar month and the rainfall
+values grouped in buckets of equal width, searched outward from the bucket of the mean for
+the value closest to it. Missing values are skipped. The buckets are narrowed every time the
+number of distinct rainfall values doubles, so they hold a few values each near the mean
+and both appends and searches are O(1) amortized. Asking for largest_area,
+average_volume, hottest_month or most_average_rainfall after an append reads these
+aggregates instead of scanning every month again, and gives the results of the functions
+of model.py on the same months.
+"""
+
+import math
+
+import numpy as np
+
+from ingest import MONTHLY_COLUMNS
+from lake_series import LakeSeries
+from model import MEAN_IMPUTED_COLUMNS, index_to_name_month
+from periods import month_number
+
+# measurement columns of a month, the same as lake_george_data.csv
+COLUMNS = [column for column in MONTHLY_COLUMNS if column != 'date']
+
+
+class IncrementalDataset:
+    """
+    Monthly Lake George data that only grows, with running summary statistics
+    Parameters
+    ----------
+    impute : [bool] - imputes appended months with the check_data_validity rules, using the means of the
+        months appended before them
+    capacity : [int] - months the column arrays hold before they grow, they double every time they are full
+    rainfall_bucket : [float] - starting width of the rainfall buckets most_average_rainfall searches, in mm,
+        they narrow as distinct values are appended
+    """
+
+    def __init__(self, impute=True, capacity=64, rainfall_bucket=1.0):
+        self.impute = impute
+        self.size = 0
+        self.periods = np.empty(capacity, dtype=np.int64)
+        self.values = {column: np.empty(capacity) for column in COLUMNS}
+        # running sum and count of every column, the means imputed values are taken from
+        self.sums = dict.fromkeys(COLUMNS, 0.0)
+        self.counts = dict.fromkeys(COLUMNS, 0)
+        self.max_area = np.nan
+        # Welford's running mean of volume and rainfall, over the values counted in counts, and the sum of
+        # squared differences from the rainfall mean
+        self.mean_volume = 0.0
+        self.mean_rainfall = 0.0
+        self.rainfall_squares = 0.0
+        # sum of max_temperature and number of months with one of each calendar month
+        self.month_temp_sum = np.zeros(12)
+        self.month_added = np.zeros(12, dtype=np.int64)
+        # bucket number of rainfall values, to the first position every distinct value of the bucket was seen at
+        self.rainfall_bucket = rainfall_bucket
+        self.rainfall_buckets = {}
+        # lowest and highest bucket number with values
+        self.rainfall_range = (math.inf, -math.inf)
+        # number of distinct rainfall values, the buckets are narrowed when it reaches rainfall_rebucket
+        self.rainfall_distinct = 0
+        self.rainfall_rebucket = 64
+
+    @classmethod
+    def from_frame(cls, data, impute=False):
+        """
+        Starts a dataset with the months of a data frame like read_dataset returns
+        Parameters
+        ----------
+        data : [pandas DataFrame]
+            dataframe consisting all data from csv file
+        impute : [bool] - imputes the months, not needed for data read by read_dataset
+        Returns
+        -------
+        IncrementalDataset
+        """
+        dataset = cls(impute, capacity=max(len(data), 1))
+        dataset.extend(data[MONTHLY_COLUMNS].to_dict('records'))
+        return dataset
+
+    def extend(self, rows):
+        """
+        Appends months in order
+        Parameters
+        ----------
+        rows : [dict] - months, see append, like the rows of ingest.monthly_rows
+        """
+        for row in rows:
+            self.append(row)
+
+    def append(self, row):
+        """
+        Appends a month and updates the summary statistics
+        Parameters
+        ----------
+        row : [dict] - date ('YYYYMM') and value of every column of COLUMNS
+        Returns
+        -------
+        list of the columns imputed
+        """
+        row, imputed = self._imputed(row) if self.impute else (row, [])
+        if self.size == len(self.periods):
+            self._grow()
+        position = self.size
+        self.periods[position] = month_number(row['date'])
+        for column in COLUMNS:
+            value = float(row[column])
+            self.values[column][position] = value
+            if not np.isnan(value):
+                self.sums[column] += value
+                self.counts[column] += 1
+        self.size += 1
+        area, volume, rainfall = self.values['area'][position], self.values['volume'][position], \
+            self.values['rainfall'][position]
+        # nan areas are skipped like the max of a data frame column
+        if np.isnan(self.max_area) or area > self.max_area:
+            self.max_area = area
+        # missing values are skipped like the mean of a data frame column
+        if not np.isnan(volume):
+            self.mean_volume += (volume - self.mean_volume) / self.counts['volume']
+        temperature = self.values['max_temperature'][position]
+        if not np.isnan(temperature):
+            month = self.periods[position] % 12
+            self.month_temp_sum[month] += temperature
+            self.month_added[month] += 1
+        if not np.isnan(rainfall):
+            difference = rainfall - self.mean_rainfall
+            self.mean_rainfall += difference / self.counts['rainfall']
+            self.rainfall_squares += difference * (rainfall - self.mean_rainfall)
+            self._add_rainfall(rainfall, position)
+        return imputed
+
+    def largest_area(self):
+        """
+        Largest area of the months appended, see model.largest_area
+        Returns
+        -------
+        float largest area
+        """
+        return self.max_area
+
+    def average_volume(self):
+        """
+        Average volume of the months appended, see model.average_volume. The running mean sums in a different
+        order than np.mean, so the last decimal can differ by one
+        Returns
+        -------
+        float round to 2 decimals - average volume
+        """
+        return round(self.mean_volume, 2)
+
+    def most_average_rainfall(self):
+        """
+        Month whose rainfall is closest to the average rainfall, see model.most_average_rainfall
+        Returns
+        -------
+        Month and year (str) whose rainfall value is closest to average rainfall
+        Raises ValueError if no month with rainfall was appended
+        """
+        if not self.rainfall_distinct:
+            raise ValueError("no rainfall appended, the most average rainfall needs at least one month")
+        average = round(self.mean_rainfall, 2)
+        # the first month of the closest rainfall, like model.most_average_rainfall
+        position = self._closest_rainfall(average)[1]
+        year, month = divmod(int(self.periods[position]), 12)
+        return index_to_name_month(month) + ", " + "{:04d}".format(year)
+
+    def hottest_month(self):
+        """
+        Calendar month with the highest average max_temperature, see model.hottest_month
+        Returns
+        -------
+        hottest month name like 'January', 'February' ...
+        """
+        month_temp_average = np.divide(self.month_temp_sum, self.month_added, out=np.zeros(12),
+                                       where=self.month_added != 0)
+        return index_to_name_month(int(np.argmax(month_temp_average)))
+
+    @property
+    def data(self):
+        """Months appended as a LakeSeries sharing memory with the dataset, for the models and other functions."""
+        periods = self.periods[:self.size]
+        return LakeSeries(periods // 12, periods % 12 + 1,
+                          {column: values[:self.size] for column, values in self.values.items()})
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "IncrementalDataset({} months)".format(self.size)
+
+    def _add_rainfall(self, rainfall, position):
+        """Adds a rainfall value to its bucket, narrowing the buckets when the distinct values double."""
+        number = math.floor(rainfall / self.rainfall_bucket)
+        bucket = self.rainfall_buckets.setdefault(number, {})
+        if rainfall in bucket:
+            return
+        bucket[rainfall] = position
+        self.rainfall_range = (min(self.rainfall_range[0], number), max(self.rainfall_range[1], number))
+        self.rainfall_distinct += 1
+        if self.rainfall_distinct < self.rainfall_rebucket:
+            return
+        self.rainfall_rebucket *= 2
+        # a few values a bucket around the mean, where about 0.4 / deviation of the values are per mm
+        deviation = math.sqrt(self.rainfall_squares / self.counts['rainfall'])
+        if deviation == 0:
+            return
+        positions = {value: position for bucket in self.rainfall_buckets.values() for value, position in bucket.items()}
+        self.rainfall_bucket = 4 * deviation / self.rainfall_distinct
+        self.rainfall_buckets = {}
+        for value, position in positions.items():
+            self.rainfall_buckets.setdefault(math.floor(value / self.rainfall_bucket), {})[value] = position
+        self.rainfall_range = (min(self.rainfall_buckets), max(self.rainfall_buckets))
+
+    def _closest_rainfall(self, average):
+        """(distance, first position) of the rainfall value closest to average, the earliest month on ties."""
+        middle = math.floor(average / self.rainfall_bucket)
+        closest = None
+        step = 0
+        # values step buckets away from the average's are at least (step - 1) widths from it, the search stops
+        # once they are further than the closest found, ties on distance are kept for the first month
+        while middle - step >= self.rainfall_range[0] or middle + step <= self.rainfall_range[1]:
+            if closest is not None and (step - 1) * self.rainfall_bucket > closest[0]:
+                break
+            for number in {middle - step, middle + step}:
+                for value, position in self.rainfall_buckets.get(number, {}).items():
+                    if closest is None or (abs(value - average), position) < closest:
+                        closest = (abs(value - average), position)
+            step += 1
+        return closest
+
+    def _grow(self):
+        """Doubles the capacity of the column arrays."""
+        capacity = max(2 * len(self.periods), 1)
+        self.periods = np.resize(self.periods, capacity)
+        self.values = {column: np.resize(values, capacity) for column, values in self.values.items()}
+
+    def _imputed(self, row):
+        """Row imputed with the rules of impute_dataset and the running means, and the columns imputed."""
+        row = dict(row)
+        imputed = []
+        date = row.get('date')
+        date = '' if date is None or date != date else str(date)
+        # impute with 000001 if missing, add extra 0 if month is missing 0
+        if len(date) < 5:
+            row['date'] = '000001'
+            imputed.append('date')
+        elif len(date) == 5:
+            row['date'] = date[:4] + '0' + date[4:]
+            imputed.append('date')
+        # swap min, max temp if max<min
+        if float(row['max_temperature']) < float(row['min_temperature']):
+            row['max_temperature'], row['min_temperature'] = row['min_temperature'], row['max_temperature']
+            imputed += ['max_temperature', 'min_temperature']
+        for column in COLUMNS:
+            value = float(row[column])
+            invalid = np.isnan(value) or (column in MEAN_IMPUTED_COLUMNS and value < 0)
+            if invalid and self.counts[column]:
+                row[column] = self.sums[column] / self.counts[column]
+                if column not in imputed:
+                    imputed.append(column)
+        return row, imputed
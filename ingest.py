@@ -0,0 +1,89 @@
+"""
+Streaming ingest of daily or sub-daily station logs into the monthly rows the models use.
+
+The log is read in fixed-size chunks. Every chunk is cleaned with the check_data_validity
+rules (chunk means are used for imputing) and reduced per month: rainfall is summed,
+temperatures, humidity, wind speed and solar exposure are averaged, and volume and area
+are taken from the last reading of the month. A month split across chunks is carried over
+to the next chunk, so only one chunk and one open month are ever held in memory.
+"""
+
+import numpy as np
+import pandas as pd
+
+from model import impute_measurements
+
+SUM_COLUMNS = ['rainfall']
+MEAN_COLUMNS = ['solar_exposure', 'max_temperature', 'min_temperature', 'humidity', 'wind_speed']
+LAST_COLUMNS = ['volume', 'area']
+# order of the columns of a monthly row, the same as lake_george_data.csv
+MONTHLY_COLUMNS = ['date', 'volume', 'area', 'solar_exposure', 'rainfall', 'max_temperature', 'min_temperature',
+                   'humidity', 'wind_speed']
+
+
+def monthly_rows(filepath, chunksize=100000, date_format=None):
+    """
+    Reads a log in chunks and yields one row per month
+    Parameters
+    ----------
+    filepath : [str or file] - csv log with the columns of lake_george_data.csv, in time order,
+        date is a day or time like 19900101, 1990-01-01 or 1990-01-01 09:00
+    chunksize : [int] - rows read at a time
+    date_format : [str] - strftime format of date, inferred if None. Rows with unreadable dates are dropped
+    Returns
+    -------
+    generator of dict with the keys of MONTHLY_COLUMNS, date as 'YYYYMM'
+    """
+    open_month = None
+    for chunk in pd.read_csv(filepath, chunksize=chunksize, dtype={'date': str}):
+        times = pd.to_datetime(chunk['date'], format=date_format, errors='coerce')
+        readable = times.notnull().to_numpy()
+        chunk = chunk[readable].reset_index(drop=True)
+        times = times[readable]
+        keys = (times.dt.year * 100 + times.dt.month).to_numpy()
+        if np.any(np.diff(keys) < 0) or (open_month is not None and len(keys) and keys[0] < open_month['key']):
+            raise ValueError("rows of {} are not in time order".format(filepath))
+        chunk = impute_measurements(chunk)[0]
+        grouped = chunk.groupby(keys, sort=False)
+        sums = grouped[SUM_COLUMNS + MEAN_COLUMNS].sum()
+        counts = grouped[MEAN_COLUMNS].count()
+        last = grouped[LAST_COLUMNS].last()
+        for key in sums.index:
+            month = {'key': key, 'sums': sums.loc[key], 'counts': counts.loc[key], 'last': last.loc[key]}
+            if open_month is not None and open_month['key'] == key:
+                # month continues from the previous chunk
+                month['sums'] = month['sums'] + open_month['sums']
+                month['counts'] = month['counts'] + open_month['counts']
+            elif open_month is not None:
+                yield _monthly_row(open_month)
+            open_month = month
+    if open_month is not None:
+        yield _monthly_row(open_month)
+
+
+def read_daily_dataset(filepath, chunksize=100000, date_format=None):
+    """
+    Reads a daily log into a monthly data frame like read_dataset
+    Parameters
+    ----------
+    filepath : [str or file] - csv log, see monthly_rows
+    chunksize : [int] - rows read at a time
+    date_format : [str] - strftime format of date, inferred if None
+    Returns
+    -------
+    pandas DataFrame with a row per month in MONTHLY_COLUMNS
+    """
+    return pd.DataFrame(list(monthly_rows(filepath, chunksize, date_format)), columns=MONTHLY_COLUMNS)
+
+
+def _monthly_row(month):
+    """Monthly row of the sums, counts and last readings of a month."""
+    row = {'date': str(month['key'])}
+    for column in LAST_COLUMNS:
+        row[column] = float(month['last'][column])
+    for column in SUM_COLUMNS:
+        row[column] = float(month['sums'][column])
+    for column in MEAN_COLUMNS:
+        count = month['counts'][column]
+        row[column] = float(month['sums'][column]) / count if count else np.nan
+    return {column: row[column] for column in MONTHLY_COLUMNS}
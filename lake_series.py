@@ -0,0 +1,109 @@
+"""
+Compact column store of Lake George data.
+
+LakeSeries keeps one contiguous NumPy array per measurement column and the dates parsed
+once into integer year and month arrays. Columns are read as attributes or items, like the
+columns of the data frame read_dataset returns, so the models, statistics and evaluation
+functions accept either. Measurements can be stored as float32 to halve their memory.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def parse_dates(dates):
+    """
+    Parses dates (YYYYMM) into years and months
+    Parameters
+    ----------
+    dates : [str or int] - dates like '199001'
+    Returns
+    -------
+    (years, months) numpy arrays of int, months are 1-12
+    """
+    dates = pd.to_numeric(pd.Series(dates)).to_numpy(dtype=np.int64)
+    return dates // 100, dates % 100
+
+
+class LakeSeries:
+    """
+    Monthly Lake George data as one typed array per column
+    Parameters
+    ----------
+    years : [int] - year of every month
+    months : [int] - month (1-12) of every month
+    columns : [dict] - column name -> values of every month, like volume, area, rainfall
+    dtype : [numpy dtype] - dtype the columns are stored as, np.float64 or np.float32
+    """
+
+    def __init__(self, years, months, columns, dtype=np.float64):
+        self.years = np.ascontiguousarray(years, dtype=np.int32)
+        self.months = np.ascontiguousarray(months, dtype=np.int32)
+        self.dtype = np.dtype(dtype)
+        self.columns = {name: np.ascontiguousarray(values, dtype=dtype) for name, values in columns.items()}
+        for name, values in self.columns.items():
+            if values.shape != self.years.shape:
+                raise ValueError("column {!r} has {} values but there are {} dates".format(
+                    name, len(values), len(self.years)))
+
+    @classmethod
+    def from_frame(cls, data, dtype=np.float64):
+        """
+        Converts a data frame like read_dataset returns
+        Parameters
+        ----------
+        data : [pandas DataFrame]
+            dataframe consisting all data from csv file
+        dtype : [numpy dtype] - dtype the columns are stored as, np.float64 or np.float32
+        Returns
+        -------
+        LakeSeries with every column of data but date
+        """
+        years, months = parse_dates(data['date'])
+        columns = {name: data[name].to_numpy(dtype=dtype) for name in data.columns if name != 'date'}
+        return cls(years, months, columns, dtype)
+
+    def to_frame(self):
+        """
+        Converts back to a data frame like read_dataset returns
+        Returns
+        -------
+        pandas DataFrame with the date column first, then every column
+        """
+        frame = pd.DataFrame({'date': self.date})
+        for name, values in self.columns.items():
+            frame[name] = values
+        return frame
+
+    @property
+    def date(self):
+        """Dates as 'YYYYMM' strings, like the date column of the data frame."""
+        return np.char.zfill((self.years.astype(np.int64) * 100 + self.months).astype(str), 6)
+
+    @property
+    def index(self):
+        """Positions of the months, like the default index of the data frame."""
+        return np.arange(len(self.years))
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays, in bytes."""
+        return self.years.nbytes + self.months.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def __len__(self):
+        return len(self.years)
+
+    def __getitem__(self, name):
+        if name == 'date':
+            return self.date
+        return self.columns[name]
+
+    def __getattr__(self, name):
+        # only called for names that are not attributes, columns are read like data frame columns
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError("LakeSeries has no column or attribute {!r}".format(name))
+
+    def __repr__(self):
+        return "LakeSeries({} months, columns {})".format(len(self), list(self.columns))
@@ -0,0 +1,133 @@
+"""
+Summary statistics of Lake George data computed with grouped reductions.
+
+Dates are parsed once per call, then every statistic is a whole-column reduction, so the
+cost grows linearly with the number of rows. Groupings are 'month' (1-12), 'year' and
+'season' (Southern Hemisphere, summer is December to February).
+"""
+
+import numpy as np
+import pandas as pd
+
+from month_statistics import closest_to_mean, date_parts, highest_average_month, month_closest_to_mean
+from periods import select, time_slice
+
+GROUPINGS = ('month', 'year', 'season')
+SEASONS = ('summer', 'autumn', 'winter', 'spring')
+
+# columns summarised when none are given
+NUMERIC_COLUMNS = ['volume', 'area', 'solar_exposure', 'rainfall', 'max_temperature', 'min_temperature',
+                   'humidity', 'wind_speed']
+
+
+def group_keys(data, by, date_columns=None):
+    """
+    Computes the group of every row
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    by : [str] - one of GROUPINGS
+    date_columns : [(years, months)] - date_parts(data), parsed again if None
+    Returns
+    -------
+    numpy array of the group of every row, ints for month and year, season names for season
+    """
+    years, months = date_parts(data) if date_columns is None else date_columns
+    if by == 'month':
+        return months
+    if by == 'year':
+        return years
+    if by == 'season':
+        return np.array(SEASONS)[(months % 12) // 3]
+    raise ValueError("by should be one of {} but is {!r}".format(GROUPINGS, by))
+
+
+def grouped_statistics(data, by='month', columns=None, reductions=('mean', 'min', 'max', 'sum', 'count'),
+                       date_columns=None, start=None, end=None):
+    """
+    Reduces columns of every group, like a per-month climatology or annual totals
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    by : [str or [str]] - one of GROUPINGS, or a list of them for nested groups like ['year', 'month']
+    columns : [str] - columns to reduce, NUMERIC_COLUMNS if None
+    reductions : [str] - pandas reductions like 'mean', 'sum', 'min', 'max', 'std', 'count'
+    date_columns : [(years, months)] - date_parts(data), parsed again if None
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    pandas DataFrame with a row per group and a (column, reduction) column per statistic
+    """
+    if date_columns is not None and (start is not None or end is not None):
+        rows = time_slice(data, start, end)
+        date_columns = (date_columns[0][rows], date_columns[1][rows])
+    data = select(data, start, end)
+    if date_columns is None:
+        date_columns = date_parts(data)
+    groupings = [by] if isinstance(by, str) else list(by)
+    keys = [pd.Series(group_keys(data, grouping, date_columns), name=grouping) for grouping in groupings]
+    columns = NUMERIC_COLUMNS if columns is None else list(columns)
+    # a frame of only the reduced columns, made the same way from a data frame or a LakeSeries
+    frame = pd.DataFrame({column: np.asarray(data[column]) for column in columns})
+    return frame.groupby(keys, sort=True).agg(list(reductions))
+
+
+def extremes(data, columns=None, start=None, end=None):
+    """
+    Finds smallest and largest value of columns and the date they happened
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    columns : [str] - columns to search, NUMERIC_COLUMNS if None
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    dict of column -> dict with min, min_date, max and max_date, the first date if a value repeats
+    """
+    data = select(data, start, end)
+    result = {}
+    dates = np.asarray(data.date)
+    for column in NUMERIC_COLUMNS if columns is None else columns:
+        values = np.asarray(data[column], dtype=float)
+        low = int(np.nanargmin(values))
+        high = int(np.nanargmax(values))
+        result[column] = {'min': values[low], 'min_date': dates[low],
+                          'max': values[high], 'max_date': dates[high]}
+    return result
+
+
+def summary_statistics(data, start=None, end=None):
+    """
+    Computes every summary statistic of data in one pass over parsed dates
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    dict with
+    largest_area, average_volume, most_average_rainfall and hottest_month like the functions of model.py,
+    monthly_climatology - mean, min, max of every column per calendar month,
+    annual_totals - sum and mean of every column per year,
+    extremes - smallest and largest value of every column and their dates
+    """
+    data = select(data, start, end)
+    date_columns = date_parts(data)
+    climatology = grouped_statistics(data, 'month', reductions=('mean', 'min', 'max'), date_columns=date_columns)
+    annual = grouped_statistics(data, 'year', reductions=('sum', 'mean'), date_columns=date_columns)
+    return {
+        'largest_area': data.area.max(),
+        'average_volume': round(np.mean(data.volume), 2),
+        'most_average_rainfall': month_closest_to_mean(data, 'rainfall', date_columns),
+        'hottest_month': highest_average_month(data, 'max_temperature', date_columns),
+        'monthly_climatology': climatology,
+        'annual_totals': annual,
+        'extremes': extremes(data),
+    }
@@ -1,144 +1,236 @@
 
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from checkpoints import Checkpoint
+from data_cache import load_cache, write_cache
+from evaporation import evaporation_rates, linear_formula
 from model_helpers import plot_volumes, volume_to_area
+from month_statistics import date_parts, highest_average_month, index_to_name_month, month_closest_to_mean
+from periods import period_index, select, select_months, time_slice
+from profiling import instrument
+from rendering import line_figure, render_figure, render_figures
 
 
-def read_dataset(filepath):
+# version of the check_data_validity rules, increase it when they change so cached datasets are rebuilt
+VALIDATION_VERSION = 1
+
+# columns of the complex model's evaporation rate and their coefficients
+EVAPORATION_COLUMNS = ['max_temperature', 'min_temperature', 'wind_speed', 'solar_exposure', 'humidity']
+COMPLEX_EVAPORATION_COEFFICIENTS = (1.6, -3, -2.5, 4.5, -0.4)
+COMPLEX_EVAPORATION_FORMULA = linear_formula(zip(EVAPORATION_COLUMNS, COMPLEX_EVAPORATION_COEFFICIENTS))
+
+
+@instrument(stage=True)
+def read_dataset(filepath, cache_dir=None):
     """
     Reads a csv file from filepath, stores as pandas dataframe and imputes any missing and inconsistent data
     Parameters
     ----------
     filepath : [str]
         path of csv file to read data
+    cache_dir : [str]
+        optional directory of binary cached datasets. The validated data frame is cached there and later
+        reads of the same file content load the cached columns without parsing or validating again
     Returns
     -------
-        data frame is returned after imputing missing and inconsistent data
+        data frame is returned after imputing missing and inconsistent data, its period index (see periods.py)
+        is built once here
     """
+    if cache_dir is not None:
+        data_frame = load_cache(filepath, cache_dir, VALIDATION_VERSION)
+        if data_frame is not None:
+            # monthly period index built once, start and end bounds of later calls are searched in it
+            period_index(data_frame)
+            return data_frame
     data_frame = pd.read_csv(filepath, dtype={'date': str})
     # checks for inconsistent or missing data and imputes it
     data_frame = check_data_validity(data_frame)
+    if cache_dir is not None:
+        write_cache(data_frame, filepath, cache_dir, VALIDATION_VERSION)
+    period_index(data_frame)
     return data_frame
 
 
-def largest_area(data):
+@instrument()
+def largest_area(data, start=None, end=None):
     """
     Computes largest value of area column in data
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
     Returns
     -------
     float largest value of area column in dataframe
     """
-    return max(data.area)
+    data = select(data, start, end)
+    return data.area.max()
 
 
-def average_volume(data):
+@instrument()
+def average_volume(data, start=None, end=None):
     """
     Computes average of volume column in dataframe
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
     Returns
     -------
     float round to 2 decimals - average of volume column in dataframe
     """
+    data = select(data, start, end)
     average_volume = np.mean(data.volume)
     return round(average_volume, 2)
 
 
-def most_average_rainfall(data):
+@instrument()
+def most_average_rainfall(data, start=None, end=None):
     """
     Computes average of rainfall column and finds value in column closest to average rainfall
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
     Returns
     -------
     Month and year (str) whose rainfall value is closest to average rainfall
     """
-    min_difference = max(data.rainfall)
-    round_average_rainfall = round(np.mean(data.rainfall), 2)
-    for i in range(len(data.index)):
-        current_difference = abs(data.rainfall[i] - round_average_rainfall)
-        # computes min_difference from average to current rainfall
-        if current_difference < min_difference:
-            min_difference = current_difference
-            req_month_index = i
-    # computes month, year of month, year index provided.
-    return index_to_name_month(int(data.date[req_month_index][4:]) - 1) + ", " + data.date[req_month_index][:4]
+    return month_closest_to_mean(select(data, start, end), 'rainfall')
 
 
-def hottest_month(data):
+@instrument()
+def hottest_month(data, start=None, end=None):
     """
     Computes sum of max_temperature of each month for all data and retrieves max of that values
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
     Returns
     -------
     hottest month name like 'January', 'February' ...
     """
-    month_temp_sum = [0 for x in range(12)]
-    month_added = [0 for x in range(12)]
-    month_temp_average =[0 for x in range(12)]
-    for i in range(len(data.index)):
-        # list of each month's individual sum of max_temperatures
-        month_temp_sum[int(data.date[i][4:]) - 1] += data.max_temperature[i]
-        # No of times each month's max_temp is added seperate for 12 months
-        month_added[int(data.date[i][4:]) - 1] += 1
-    # Denominator may  be different for each month in avg calculation
-    for i in range(12):
-        #Average calculated if only atleast that month is added atleast once
-        if month_added[i] !=0:
-            month_temp_average[i] = (month_temp_sum[i] / month_added[i])
-    hot_month_index = month_temp_average.index(max(month_temp_average))
-    hot_month_name = index_to_name_month(hot_month_index)
-    return hot_month_name
-
-
-def area_vs_volume(data):
+    return highest_average_month(data, 'max_temperature', start=start, end=end)
+
+
+@instrument(stage=True)
+def area_vs_volume(data, show=True, workers=None, changes=None):
     """
     Plots 2 graphs based on areas, volumes of lake George over the months from 1990 to 2018
     1. plots % change in areas, volumes compared to initial areas, volumes(1990 Jan)
     2.Plots % change in areas, volumes comapred to previous month's areas, volumes
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
+    show : [bool] - show the graphs, if False they are only rendered off-screen to their files
+    workers : [int] - number of processes rendering the graphs off-screen, see render_figures
+    changes : [dict] - results of percent_changes of data with lag 1 to plot, computed if None
     """
-    volumes = [0]
-    areas = [0]
-    areas2 = areas[:]
-    volumes2 = volumes[:]
+    if changes is None:
+        changes = percent_changes(data)
+    areas, volumes = changes['area_baseline'], changes['volume_baseline']
+    # the graph of changes from the previous month starts at 0, like the one of changes from the initial month
+    areas2 = np.concatenate([[0], changes['area_lag_1'][1:]])
+    volumes2 = np.concatenate([[0], changes['volume_lag_1'][1:]])
     index_list = data.index
-    for i in range(1, len(data.index)):
-        # change % of areas compared to initial
-        areas.append(((data.area[i] / data.area[0]) - 1) * 100)
-        # change % of volume compared to initial
-        volumes.append(((data.volume[i] / data.volume[0]) - 1) * 100)
-        # change % of areas compared to previous month's area
-        areas2.append(((data.area[i] / data.area[i - 1]) - 1) * 100)
-        # change % of volume compared to previous month's volume
-        volumes2.append(((data.volume[i] / data.volume[i - 1]) - 1) * 100)
     y_label_1 = '% change from the initial value'
     y_label_2 = '% change from the previous month'
     image_name = 'Area_vs_volume_initial'
     image_name_2 = 'Area_vs_volume_previous'
+    if not show:
+        # both graphs are independent, rendered together
+        render_figures([_graph_figure(index_list, areas, volumes, y_label_1, image_name),
+                        _graph_figure(index_list, areas2, volumes2, y_label_2, image_name_2)], workers)
+        return
     # plot initial difference
     plot_graph(index_list, areas, volumes, y_label_1, image_name)
     # plot previous month's difference
     plot_graph(index_list, areas2, volumes2, y_label_2, image_name_2)
 
 
-def plot_graph(index_list, areas, volumes, y_label, image_name):
+@instrument()
+def percent_changes(data, columns=('area', 'volume'), baseline=0, lags=(1,), windows=(), zero_reference=np.nan,
+                    start=None, end=None):
+    """
+    Computes % changes of columns compared to a baseline month, to the months lags before and to the mean of
+    rolling windows of the months before, as whole-array operations
+    Parameters
+    ----------
+    data : [pandas DataFrame, LakeSeries or dict]
+        dataframe consisting all data from csv file, or column name -> values of every month, the months along
+        the last axis, e.g. shape (lakes, months) for many lakes. A dict has no dates, it takes a baseline position
+        and no start or end
+    columns : [str] - columns to compute changes of
+    baseline : [int, str or pandas Period] - position of the baseline month, from 0, or a month like '2000-01'
+    lags : [int] - months between each month and the month it is compared to, like 1 or 12
+    windows : [int] - number of months before each month whose mean it is compared to
+    zero_reference : [float] - change from a reference of 0 to a value other than 0, a change from 0 to 0 is 0
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    dict of '<column>_baseline', '<column>_lag_<lag>' and '<column>_rolling_<window>' -> numpy array of the
+    % change of every month, nan for the first months that have no month lags or window months before them
+    Raises ValueError if baseline is not a month of data, or if a dict is given a month or start and end
+    """
+    if isinstance(data, dict) and not (isinstance(baseline, (int, np.integer)) and start is None and end is None):
+        raise ValueError("data given as a dict has no dates, give baseline as a position and no start or end")
+    data = select(data, start, end)
+    if isinstance(baseline, (int, np.integer)):
+        position = int(baseline)
+    else:
+        rows = time_slice(data, baseline, baseline)
+        if rows.start == rows.stop:
+            raise ValueError("there is no month {} in data".format(baseline))
+        position = rows.start
+    if any(lag < 1 for lag in lags) or any(window < 1 for window in windows):
+        raise ValueError("lags and windows should be at least 1 month")
+    changes = {}
+    for column in columns:
+        values = np.asarray(data[column], dtype=float)
+        months = values.shape[-1]
+        if not 0 <= position < months:
+            raise ValueError("baseline {} is not a month of data, positions go from 0 to {}".format(baseline,
+                                                                                                   months - 1))
+        changes[column + '_baseline'] = _percent_change(values, values[..., position:position + 1], zero_reference)
+        for lag in lags:
+            change = np.full(values.shape, np.nan)
+            change[..., lag:] = _percent_change(values[..., lag:], values[..., :max(months - lag, 0)],
+                                                zero_reference)
+            changes['{}_lag_{}'.format(column, lag)] = change
+        for window in windows:
+            change = np.full(values.shape, np.nan)
+            if window < months:
+                # mean of the window months before every month from the window-th on
+                means = np.lib.stride_tricks.sliding_window_view(values, window, axis=-1)[..., :-1, :].mean(axis=-1)
+                change[..., window:] = _percent_change(values[..., window:], means, zero_reference)
+            changes['{}_rolling_{}'.format(column, window)] = change
+    return changes
+
+
+def _percent_change(values, reference, zero_reference):
+    """(values / reference - 1) * 100, zero_reference where reference is 0 and 0 where both are 0."""
+    values, reference = np.broadcast_arrays(values, reference)
+    zero = reference == 0
+    change = np.divide(values, reference, out=np.full(values.shape, np.nan), where=~zero)
+    change = (change - 1) * 100
+    change[zero] = np.where(values[zero] == 0, 0.0, zero_reference)
+    return change
+
+
+@instrument(stage=True)
+def plot_graph(index_list, areas, volumes, y_label, image_name, show=True):
     """
     Plots a graph for areas list, volumes list against index_list , y_label
     Parameters
@@ -148,105 +240,276 @@ def plot_graph(index_list, areas, volumes, y_label, image_name):
     volumes : [float] - list of volume values to plot on y-axis
     y_label : [str] - label for y-axis
     image_name : [str]- name to save the plot(fig)
+    show : [bool] - show the plot, if False it is only rendered off-screen to image_name
 
     """
+    if not show:
+        render_figure(_graph_figure(index_list, areas, volumes, y_label, image_name))
+        return
+    # loaded on first use, most users of this module never plot
+    import matplotlib.pyplot as plt
     a = plt.plot(index_list, areas, 1, color='b')
     b = plt.plot(index_list, volumes, 1, color='orange')
-    plt.savefig(image_name, format="svg")
     # For identification of area, volume in the plot
     plt.legend((a[0], b[0]), ("areas", "volumes"))
     plt.xlabel('Time(months) from Jan 1990 to Dec 2018')
     plt.ylabel(y_label)
     plt.title('% changes in areas, volumes of Lake George over time')
+    # saved once the legend and labels are added
+    plt.savefig(image_name, format="svg")
     plt.show()
 
 
-def lake_george_simple_model(data, evaporation_rate):
+def _graph_figure(index_list, areas, volumes, y_label, image_name):
+    """
+    Off-screen figure of plot_graph, long series are downsampled
+    Returns
+    -------
+    FigureSpec to render with render_figure
+    """
+    return line_figure(image_name, [(index_list, areas, 'areas', 'b'), (index_list, volumes, 'volumes', 'orange')],
+                       'Time(months) from Jan 1990 to Dec 2018', y_label,
+                       '% changes in areas, volumes of Lake George over time', format='svg')
+
+
+@instrument(stage=True)
+def lake_george_simple_model(data, evaporation_rate, checkpoint=None, start=None, end=None):
     """
     Predicts volumes for evry month based on its rainfall, constant evaporation rate (simple model)
     (current volume = previous volume + rainfall received - evaporated)
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
     evaporation_rate : [int or float]
         rate for calculating water(in litres) evaporating per square meter
+    checkpoint : [Checkpoint] - state of a month to resume from, the first month of data if None
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
     Returns
     -------
     volumes [float]
-    list of volumes predicted for every month using a simple model
+    list of volumes predicted for every month using a simple model, from the checkpoint's month if resumed
     """
+    data = select(data, start, end)
     # Considering max area of lake as catchment area
     catchment_area = largest_area(data)
-    rainfall_received = [data.rainfall[0] * catchment_area]
-    evaporated = [data.area[0] * evaporation_rate]
-    volumes_list = [data.volume[0]]
+    # columns read once as arrays, indexing them is much cheaper than indexing the data frame
+    rainfall = np.asarray(data.rainfall, dtype=float)
+    start, start_volume, start_area = _start_state(data, checkpoint)
+    rainfall_received = [rainfall[start] * catchment_area]
+    evaporated = [start_area * evaporation_rate]
+    volumes_list = [start_volume]
     # considering current area as surface area, is used for next month's prediction
-    surface_area = [data.area[0]]
-    for i in range(1, len(data.index)):
+    surface_area = [start_area]
+    for i in range(start + 1, len(rainfall)):
         # total rainfall received for the entire month
-        rainfall_received.append(data.rainfall[i] * catchment_area)
+        rainfall_received.append(rainfall[i] * catchment_area)
         #total evaporated water for entire month
-        evaporated.append(evaporation_rate * surface_area[i - 1])
+        evaporated.append(evaporation_rate * surface_area[-1])
         # Predicted volume for ith month - simple model
-        volumes_list.append(volumes_list[i - 1] + rainfall_received[i] - evaporated[i])
+        volumes_list.append(volumes_list[-1] + rainfall_received[-1] - evaporated[-1])
         # Surface area updating for next month's prediction usage
-        surface_area.append(volume_to_area(volumes_list[i]))
+        surface_area.append(volume_to_area(volumes_list[-1]))
     return volumes_list
 
 
-def lake_george_complex_model(data):
+@instrument(stage=True)
+def lake_george_complex_model(data, formula=COMPLEX_EVAPORATION_FORMULA, checkpoint=None, start=None, end=None):
     """
     Predicts volumes for evry month based on its rainfall, changing evaporation rate depending on temperatures,
     windspeed, solar exposure and humidity (Complex model)
     (current volume = previous volume + rainfall received - evaporated) but evaporation rate changes every month
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
+    formula : [EvaporationFormula]
+        evaporation rate formula, see evaporation.py, -3T(min) + 1.6T(max) - 2.5W + 4.5S - 0.4H by default
+    checkpoint : [Checkpoint] - state of a month to resume from, the first month of data if None
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
     Returns
     -------
     volumes [float]
-    list of volumes predicted for every month using complex model
+    list of volumes predicted for every month using complex model, from the checkpoint's month if resumed
     """
+    data = select(data, start, end)
     # Considering max area of lake as catchment area
     catchment_area = largest_area(data)
-    rainfall_received = [data.rainfall[0] * catchment_area]
-    evaporated = [data.area[0] * (
-            (1.6 * data.max_temperature[0]) - (3 * data.min_temperature[0]) - (2.5 * data.wind_speed[0]) + (
-            4.5 * data.solar_exposure[0]) - (0.4 * data.humidity[0]))]
-    volumes_list = [data.volume[0]]
-    surface_area = [data.area[0]]
-    for i in range(1, len(data.index)):
-        #Evaporation rate changes every month unlike simple model
-        evaporation_rate = (1.6 * data.max_temperature[i]) - (3 * data.min_temperature[i]) - (
-                2.5 * data.wind_speed[i]) + (4.5 * data.solar_exposure[i]) - (0.4 * data.humidity[i])
+    #Evaporation rate changes every month unlike simple model, computed for all months at once
+    evaporation_rate = evaporation_rates(data, formula)
+    rainfall = np.asarray(data.rainfall, dtype=float)
+    start, start_volume, start_area = _start_state(data, checkpoint)
+    rainfall_received = [rainfall[start] * catchment_area]
+    evaporated = [start_area * evaporation_rate[start]]
+    volumes_list = [start_volume]
+    surface_area = [start_area]
+    for i in range(start + 1, len(rainfall)):
         #total rainfall received for the entire month
-        rainfall_received.append(data.rainfall[i] * catchment_area)
+        rainfall_received.append(rainfall[i] * catchment_area)
         # total evaporated water for entire month
-        evaporated.append(evaporation_rate * surface_area[i - 1])
+        evaporated.append(evaporation_rate[i] * surface_area[-1])
         #Predicted volume for ith month - complex model
-        volumes_list.append(volumes_list[i - 1] + rainfall_received[i] - evaporated[i])
+        volumes_list.append(volumes_list[-1] + rainfall_received[-1] - evaporated[-1])
         #surface area computed to be used in next month's prediction
-        surface_area.append(volume_to_area(volumes_list[i]))
+        surface_area.append(volume_to_area(volumes_list[-1]))
     return volumes_list
 
 
-def evaluate_model(data, volumes):
+def _start_state(data, checkpoint):
+    """(month, volume, surface area) a model starts from, the first month of data or a checkpoint."""
+    if checkpoint is None:
+        return 0, data.volume[0], data.area[0]
+    return checkpoint.month, checkpoint.volume, checkpoint.surface_area
+
+
+@instrument(stage=True)
+def lake_george_batch_model(data, evaporation_rates, catchment_areas=None, start_volumes=None, checkpoint=None,
+                            checkpoint_months=(), on_checkpoint=None, start=None, end=None):
+    """
+    Predicts volumes for many scenarios at once, every scenario is advanced together one month at a time
+    (current volume = previous volume + rainfall received - evaporated), same as lake_george_simple_model
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    evaporation_rates : [float or numpy array]
+        one constant rate per scenario (shape (scenarios,)) or a monthly rate per scenario
+        (shape (scenarios, months)), like complex_evaporation_rates(data)[np.newaxis, :]
+    catchment_areas : [float or numpy array] - catchment area per scenario, largest_area(data) if None
+    start_volumes : [float or numpy array] - volume of first month per scenario, data.volume[0] if None.
+        Surface area of the first month is data.area[0] if None, else computed with volume_to_area
+    checkpoint : [Checkpoint] - state of a month to resume from instead of start_volumes
+    checkpoint_months : [int] - positions in data of the months whose state is passed to on_checkpoint,
+        like range(0, len(data), 120) for a checkpoint every 10 years
+    on_checkpoint : [function] - on_checkpoint(Checkpoint) called at every month of checkpoint_months,
+        like a_list.append to keep them in memory or checkpoints.checkpoint_saver(path) to save them
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+        Monthly evaporation_rates may be given for every month of data or only for these months
+    Returns
+    -------
+    numpy array of shape (scenarios, months) - volumes predicted for every scenario and month,
+    from the checkpoint's month if resumed
+    """
+    rates = np.asarray(evaporation_rates, dtype=float)
+    if rates.ndim == 2:
+        rates = select_months(rates, data, start, end)
+    data = select(data, start, end)
+    if catchment_areas is None:
+        catchment_areas = largest_area(data)
+    first_month = 0
+    if checkpoint is not None:
+        if start_volumes is not None:
+            raise ValueError("start_volumes and checkpoint can not both be given")
+        first_month, start_volumes, start_areas = checkpoint
+    elif start_volumes is None:
+        start_volumes = data.volume[0]
+        start_areas = data.area[0]
+    else:
+        start_areas = volume_to_area(np.asarray(start_volumes, dtype=float))
+    if rates.ndim == 2:
+        # monthly rates of every scenario, from the month resumed
+        rates = rates[:, first_month:]
+    return simulate_volumes(np.asarray(data.rainfall, dtype=float)[first_month:], rates, catchment_areas,
+                            start_volumes, start_areas, checkpoint_months, on_checkpoint, first_month)
+
+
+@instrument()
+def simulate_volumes(rainfall, evaporation_rates, catchment_areas, start_volumes, start_areas, checkpoint_months=(),
+                     on_checkpoint=None, first_month=0):
+    """
+    Advances every scenario together one month at a time from its first month's volume and surface area
+    (current volume = previous volume + rainfall received - evaporated)
+    Parameters
+    ----------
+    rainfall : [numpy array] - monthly rainfall, shape (months,) shared by all scenarios or (scenarios, months)
+    evaporation_rates : [float or numpy array] - constant rate per scenario (shape (scenarios,)) or
+        monthly rate per scenario (shape (scenarios, months))
+    catchment_areas : [float or numpy array] - catchment area per scenario
+    start_volumes : [float or numpy array] - volume of first month per scenario
+    start_areas : [float or numpy array] - surface area of first month per scenario
+    checkpoint_months : [int] - months whose state is passed to on_checkpoint, counted like first_month
+    on_checkpoint : [function] - on_checkpoint(Checkpoint) called at every month of checkpoint_months
+    first_month : [int] - month number of the first month, for the months of checkpoints
+    Returns
+    -------
+    numpy array of shape (scenarios, months) - volumes predicted for every scenario and month
+    """
+    rainfall = np.asarray(rainfall, dtype=float)
+    months = rainfall.shape[-1]
+    rainfall = rainfall.reshape(-1, months)
+    rates = np.asarray(evaporation_rates, dtype=float)
+    if rates.ndim < 2:
+        # constant evaporation rate of each scenario
+        rates = rates.reshape(-1, 1)
+    catchment_areas = np.reshape(np.asarray(catchment_areas, dtype=float), -1)
+    start_volumes = np.reshape(np.asarray(start_volumes, dtype=float), -1)
+    start_areas = np.reshape(np.asarray(start_areas, dtype=float), -1)
+    scenarios = np.broadcast_shapes(rainfall.shape[:1], rates.shape[:1], catchment_areas.shape,
+                                    start_volumes.shape, start_areas.shape)[0]
+    rates = np.broadcast_to(rates, (scenarios, months))
+    rainfall = np.broadcast_to(rainfall, (scenarios, months))
+    volumes = np.empty((scenarios, months))
+    # state of every scenario, previous month's volume and surface area
+    current_volume = np.broadcast_to(start_volumes, (scenarios,))
+    surface_area = np.broadcast_to(start_areas, (scenarios,))
+    volumes[:, 0] = current_volume
+    checkpoint_months = set(checkpoint_months) if on_checkpoint is not None else set()
+    if first_month in checkpoint_months:
+        on_checkpoint(Checkpoint(first_month, np.array(current_volume), np.array(surface_area)))
+    for i in range(1, months):
+        current_volume = current_volume + rainfall[:, i] * catchment_areas - rates[:, i] * surface_area
+        volumes[:, i] = current_volume
+        surface_area = volume_to_area(current_volume)
+        if first_month + i in checkpoint_months:
+            on_checkpoint(Checkpoint(first_month + i, current_volume.copy(), surface_area.copy()))
+    return volumes
+
+
+def complex_evaporation_rates(data, coefficients=COMPLEX_EVAPORATION_COEFFICIENTS):
+    """
+    Computes evaporation rate of every month used by lake_george_complex_model
+    (Evaporation rate = -3T(min) + 1.6T(max) - 2.5W + 4.5S - 0.4H)
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    coefficients : [float or numpy array] - coefficient of each column of EVAPORATION_COLUMNS, in the same order.
+        Arrays of coefficients broadcast against the columns, e.g. shape (scenarios, 1) gives (scenarios, months)
+    Returns
+    -------
+    numpy array of float - evaporation rate of every month
+    """
+    # evaluated directly, arrays of coefficients cannot key the cache of evaporation_rates
+    formula = linear_formula(zip(EVAPORATION_COLUMNS, coefficients))
+    return formula.function({column: np.asarray(data[column], dtype=float) for column in formula.columns})
+
+
+@instrument(stage=True)
+def evaluate_model(data, volumes, start=None, end=None):
     """
     Calculates mean absolute error for volume in dataframe(expected) and volumes(predicted)
     Parameters
     ----------
-    data : [pandas DataFrame]
+    data : [pandas DataFrame or LakeSeries]
         dataframe consisting all data from csv file
     volumes : [float]
         List of volumes, in litres, like output by lake_george_simple_model
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+        volumes may be given for every month of data or only for these months
     Returns
     -------
     mean_absolute_error [float] litres - mean error in volumes compared to (data.volumes)
+    See evaluation.py for more metrics and for scoring many predictions at once
     """
+    volumes = select_months(volumes, data, start, end)
+    data = select(data, start, end)
     #calculates absolute volume changes of expected and predicted volumes of model
-    errors = [np.abs(data.volume[i] - volumes[i]) for i in range(len(data.volume))]
+    expected = np.asarray(data.volume, dtype=float)
+    errors = np.abs(expected - np.asarray(volumes, dtype=float)[:len(expected)])
     #plots a histogram for these errors with frequency
 # =============================================================================
 #     plt.hist(errors)
@@ -260,46 +523,11 @@ def evaluate_model(data, volumes):
     return mean_absolute_error
 
 
-def index_to_name_month(month_index):
-    """
-    Converts month index(int) 0-11 to respective months
-    Parameters
-    ----------
-    month_index : [int]
-        integer to convert to month name from 0-11
-    Returns
-    Month name(str) to corresponding month_index (0-11)0- January...11-December
-    if index not in between 0-11, returns None
-
-    """
-    if month_index == 0:
-        return 'January'
-    elif month_index == 1:
-        return 'February'
-    elif month_index == 2:
-        return 'March'
-    elif month_index == 3:
-        return 'April'
-    elif month_index == 4:
-        return 'May'
-    elif month_index == 5:
-        return 'June'
-    elif month_index == 6:
-        return 'July'
-    elif month_index == 7:
-        return 'August'
-    elif month_index == 8:
-        return 'September'
-    elif month_index == 9:
-        return 'October'
-    elif month_index == 10:
-        return 'November'
-    elif month_index == 11:
-        return 'December'
-    else:
-        return None
+# columns imputed with the column mean when a value is negative or missing, in the order they are checked
+MEAN_IMPUTED_COLUMNS = ['volume', 'area', 'humidity', 'wind_speed', 'solar_exposure', 'rainfall']
 
 
+@instrument(stage=True)
 def check_data_validity(data):
     """
     Performs validation checks on all columns of dataframe, imputes if necessary
@@ -311,45 +539,110 @@ def check_data_validity(data):
     Data frame with imputations if they were detected.
 
     """
-    for i in range(len(data.index)):
-        # swap min, max temp if max<min
-        if data.max_temperature[i] < data.min_temperature[i]:
-            temp = data.max_temperature[i]
-            data.loc[i, 'max_temperature'] = data.min_temperature[i]
-            data.loc[i, 'min_temperature'] = temp
-        # impute with mean if null
-        if pd.isnull(data.loc[i, 'max_temperature']) is True:
-            data.loc[i, 'max_temperature'] = np.mean(data.max_temperature)
-        # impute with mean if null
-        if pd.isnull(data.loc[i, 'min_temperature']) is True:
-            data.loc[i, 'min_temperature'] = np.mean(data.min_temperature)
-        # impute with 000001 if null
-        if pd.isnull(data.loc[i, 'date']) is True or len(data.date[i]) < 5:
-            data.loc[i, 'date'] = '000001'
-        # Add extra 0 as month is missing 0
-        if (len(data.date[i]) == 5):
-            data.loc[i, 'date'] = data.date[i][:4] + '0' + data.date[i][4:]
-        # impute with mean if null or <0
-        if data.volume[i] < 0 or pd.isnull(data.loc[i, 'volume']) is True:
-            data.loc[i, 'volume'] = np.mean(data.volume)
-        # impute with mean if null or <0
-        if data.area[i] < 0 or pd.isnull(data.loc[i, 'area']) is True:
-            data.loc[i, 'area'] = np.mean(data.area)
-        # impute with mean if null or <0
-        if data.humidity[i] < 0 or pd.isnull(data.loc[i, 'humidity']) is True:
-            data.loc[i, 'humidity'] = np.mean(data.humidity)
-        # impute with mean if null or <0
-        if data.wind_speed[i] < 0 or pd.isnull(data.loc[i, 'wind_speed']) is True:
-            data.loc[i, 'wind_speed'] = np.mean(data.wind_speed)
-        # impute with mean if null or <0
-        if data.solar_exposure[i] < 0 or pd.isnull(data.loc[i, 'solar_exposure']) is True:
-            data.loc[i, 'solar_exposure'] = np.mean(data.solar_exposure)
-        # impute with mean if null or <0
-        if data.rainfall[i] < 0 or pd.isnull(data.loc[i, 'rainfall']) is True:
-            data.loc[i, 'rainfall'] = np.mean(data.rainfall)
+    data, report = impute_dataset(data)
     return data
 
 
+def impute_dataset(data):
+    """
+    Applies every validation rule of check_data_validity as a whole-column operation and reports changed cells
+    1. swaps min, max temperature where max < min, missing temperatures are imputed with the column mean
+    2. missing or too short dates become '000001', dates with a single digit month are padded with 0
+    3. negative or missing volume, area, humidity, wind_speed, solar_exposure, rainfall are imputed with the mean
+    Imputed means are those of imputing row by row: each column sum is computed once and updated with
+    every imputed value, so a later imputation sees the earlier ones. Updating the sum instead of summing the
+    column again can round differently, so imputed values after the first of a column may differ from the
+    row by row ones in the last bit.
+    Parameters
+    ----------
+    data : [pandas DataFrame]
+        dataframe consisting all data from csv file
+    Returns
+    -------
+    (data, report) - data frame with imputations, dict of column name -> numpy array of changed row positions
+    """
+    data, report = impute_measurements(data)
+    # impute with 000001 if null, add extra 0 if month is missing 0
+    dates = data['date']
+    missing_date = (dates.isnull() | (dates.str.len() < 5)).to_numpy()
+    dates = dates.where(~missing_date, '000001')
+    short_month = (dates.str.len() == 5).to_numpy()
+    data['date'] = dates.where(~short_month, dates.str[:4] + '0' + dates.str[4:])
+    report['date'] = np.flatnonzero(missing_date | short_month)
+    return data, report
+
+
+def impute_measurements(data):
+    """
+    Applies the temperature and mean imputation rules of impute_dataset, every rule except the date one
+    Parameters
+    ----------
+    data : [pandas DataFrame]
+        dataframe with the measurement columns of the csv file, at any time step
+    Returns
+    -------
+    (data, report) - data frame with imputations, dict of column name -> numpy array of changed row positions
+    """
+    report = {}
+    max_temperature = data['max_temperature'].to_numpy(dtype=float)
+    min_temperature = data['min_temperature'].to_numpy(dtype=float)
+    # swap min, max temp if max<min (comparisons with missing values are False, same as the row checks)
+    swap = max_temperature < min_temperature
+    # a swap only changes the column sums seen by the imputations of later rows, so the swaps of rows
+    # after each row are taken back out of the swapped column sums
+    swap_change = np.cumsum(np.where(swap, min_temperature - max_temperature, 0))
+    swap_shift = swap_change - swap_change[-1:]
+    swapped_max = np.where(swap, min_temperature, max_temperature)
+    swapped_min = np.where(swap, max_temperature, min_temperature)
+    max_temperature, max_imputed = _impute_running_mean(swapped_max, np.isnan(swapped_max), swap_shift)
+    min_temperature, min_imputed = _impute_running_mean(swapped_min, np.isnan(swapped_min), -swap_shift)
+    data['max_temperature'] = max_temperature
+    data['min_temperature'] = min_temperature
+    report['max_temperature'] = np.flatnonzero(swap | max_imputed)
+    report['min_temperature'] = np.flatnonzero(swap | min_imputed)
+    # impute with mean if null or <0
+    for column in MEAN_IMPUTED_COLUMNS:
+        values = data[column].to_numpy(dtype=float)
+        invalid = np.isnan(values) | (values < 0)
+        report[column] = np.flatnonzero(invalid)
+        if invalid.any():
+            data[column] = _impute_running_mean(values, invalid)[0]
+    return data, report
+
+
+@instrument()
+def _impute_running_mean(values, invalid, sum_shift=None):
+    """
+    Imputes invalid values with the running mean of the column, as if imputed one row at a time
+    Parameters
+    ----------
+    values : [numpy array of float]
+        column values, missing values are nan
+    invalid : [numpy array of bool]
+        cells to impute
+    sum_shift : [numpy array of float] - optional difference between the column sum seen at each row and the sum of
+        values (temperature swaps of later rows)
+    Returns
+    -------
+    (imputed values, invalid mask)
+    """
+    imputed = values.copy()
+    present = ~np.isnan(values)
+    # summed like the pandas mean of the column, missing values as 0
+    total = np.where(present, values, 0).sum()
+    count = np.count_nonzero(present)
+    # only the invalid cells are visited, the column sum and count are updated instead of recomputed
+    for i in np.flatnonzero(invalid):
+        mean = (total + (sum_shift[i] if sum_shift is not None else 0)) / count
+        if present[i]:
+            total += mean - values[i]
+        else:
+            total += mean
+            count += 1
+        imputed[i] = mean
+    return imputed, invalid
+
+
 if __name__ == '__main__':
     data = read_dataset("lake_george_data.csv")
 
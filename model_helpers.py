@@ -9,59 +9,79 @@ Updated 20 May 2020 by Malcolm.
 """
 
 import base64
+import collections
+import functools
 import lzma
 
-import matplotlib.pyplot as plt
 import numpy
 
-def plot_volumes(volumes):
+from profiling import instrument
+from rendering import line_figure, render_figure
+
+# Actual Lake George volumes, base64 of lzma compressed '|' separated litres.
+_LGD = b'/Td6WFoAAATm1rRGAgAhARYAAAB0L+Wj4A/RB5xdABiOXARmN07zFZFMzRkdPJlEM5717W' +\
+       b'kTa6QJZTiTMmDCvEoaeY2/hZSQTqmAG72VrutkbTk0X81VxizGkX7hAnsEPbqRMYLqs1K7' +\
+       b'73SPla3TGeF/i18v4z7sIsnGIAs0nOCfiYKJMwYV79ny8fsk/CDRL7qpWyAOu//64AXXfR' +\
+       b'TAvYfLixyDfNuxD43hNOnNrivVrDvv94TLCbS4IDLtL+v36Y7Xie3FwPtwO0WRSrnaBY/4' +\
+       b'sWlQc4PTsvD/64SnBBaTvxrSrDJwZV3qMcin1SCoibMGrkO0f7zhGEC15q/2ZEHNjCUx7A' +\
+       b'RLdGayhOdItEg8LiJmzg7/uyPaFRANyy/woMF+Yzf/SJTA2Fz+K9k8OL2gKg/1ty6QisJ4' +\
+       b'tc8OkcvZvTpLvjGqQVy7fSaRLDTPJGZNn05cL95825Ic7JtXB0OIT0HICfnFUObfVctAeP' +\
+       b'aiFDsdcMsagJBEW8e/IbCGt5BH2GeLoodOEcL0XwZnfZX7JNvZAJBYR5kN+OcCZgua1Qh5' +\
+       b'V3we2SBL9jZL1WYSgoYSoyGPCA79VzOko+pM5WJArSWf8oDWBMCnWUjpugmF7N/29m/QK7' +\
+       b'KeEshwprc3UsgxiFBNGP6qW8rWDJZf9yVo1Yu0lbcTzCIDNe7Aq3JrR3EcY+p36FtH3rOx' +\
+       b'H/ljGO+GDGXO1LaL/GBBWaqHcC7Di5WsgnhUK6aBj1tY4VLc8TsrB4OguCO4h385MTIGPA' +\
+       b'RgW0QUbIb64eNF7A+5D0SeAGWxpcVxLfUOvMwQeXWYw7B6WmHOD0Z8Sg/PrCrI/FCGld32' +\
+       b'U130fDvAlSiJUZvIZR0c2GJeGHFvlWzM58H19UPaQl30F4Zt2LLMyG2AxNEwwdRkrGG92Y' +\
+       b'HshOyoPJkPWGvRPs7QMQqRmAI+2ywoCq/AP4iKsiSkndmgGWkX0c1Gp+rOX/lAtQLWJeaU' +\
+       b'xMqq2tByh+KqydKdZrrIjwF83Z0bkKtmK2+ZKYxvi6FgkCHpYAZaq3WMG8WqVbo/GBRDzg' +\
+       b'DjHXnkmJImNMXqNYN1lt5lwuCrPkhcs2wMlPy/TLb6qS5B4QfYGZkQEAGfW0YAICWdNF7b' +\
+       b'tmCmd/QTQbme1Chkqtcg+QCPjlALoezSwtI5f9koN8AZ9AACiRYcniaiM0FqhtqBsxNqTj' +\
+       b'3XaH9cL2k6FqrV2pvojKes0JzNN/eg1Acvlm6G3F5RDo7EXZlUXCiQr1V8TaA6gvvrW76H' +\
+       b'0WEaEYwh1SjyKlTEqifb3CG7umLDQ3q2uYghdu5qleP8zPX5ynNKvwYwpePjIM1tR2h7eP' +\
+       b'VQSor0CcLHEBDwJWev4mxwsRfmQO2LVKr6oIaHeQSe+iLRPcB3SD/FV/yRsCHZdVDLrAbC' +\
+       b'NimBgcxZCfP2rb7lq41ZhRqgfuQ5rnMdNPR6fgy8pJbjb/XsVq3opY9mOKEfBj5SJqdHbL' +\
+       b'HWhApXbgCxIMzHaQxg/NRLsxMxBhlmWTPyuhA+c0g7RXtvfdhv+0ZdcJHDd7PIN53uoCqO' +\
+       b'54GMIa+TuR3YzPEGzCaWwyRUdW/m2QQHe+smx0SJ5qBTvMTeZbt/RT1C+pUfM7YQceNDAz' +\
+       b'6ccFh/jHe8hNYDPKIEVoby1/KnA6FgoRc8ZwIdREZClW9aWR9u5hOfcOq733k1wc2sN61P' +\
+       b'v4KJoUhIY/Kn0JZACvexy8yDMoBsrcTTJFMgk8jSXkYNMijKpqYU/lbsqQ0jl5EspruVev' +\
+       b'qZmtTQJzlbpeYykbx1X7f36to1YejRMhNBbmljOfEM7UEjBrAHoPrC514nwbw++C9cocO1' +\
+       b'KZ2E4wIpFrdTxcVF3a7rRBvSro+I96I+5FwSaBzaYtYjCLpNfVVhYX54pW30Wjy3MXTxKj' +\
+       b'OUveFfZc5aB7PF2a1D4zyGJMhz9GepYhWb83pZ8uLXlari8oDZwhGh+OQyXeYUwIUnp9n3' +\
+       b'IAhJkrMS29P6cVcp2jqYVxdW0kaJ5PbgNsljlu4jSIanvjTxBwjd3suTGc0UPdP8OL48Dx' +\
+       b'i61GTrhquDuBBF3gAszoo33cnojR8Rsq9GnFZXscewUwgHGHAFGQA6GZ6eOKRo0NuU3DFa' +\
+       b'U4s5DaUAt86afAM0/tq7uIF/f4igwt1gXmLTGY26gx+dW4yWYKqZzmxzzmKvQvTrJHt5xv' +\
+       b'JWEtoh7HfM+cvCLF/Af6CxvxtZ2igmcJY1qE5Bahy/WNK7YgvtWCl0Igsqb2qu2iXrKZt6' +\
+       b'HGn+yO4f7bdwFs9vU65LERrI6kPO+kA09FKENZJV/bL1jr8bXQ3e/jmtdJwH8BYIWwHW2K' +\
+       b'MwyEgBnlpG8D70VopJ4exKuX5PSxwy1wWOJ6SeH/TLEZRxa9lS14Y6tQq5X1qRKJyiErvj' +\
+       b'ccLs8iNH33KtQO6825BNtOyXc59DFzJOXzoR5dME0/vfqCb74l3GiRh1i6G3WE0xM0WgC7' +\
+       b'S6KWb0DpA3sespnMqMtO0Q/uHoiaHguxHVJPhEYw7qJPVoeGxp+ztAPfWJ7yzFpqoSLRxP' +\
+       b'CbVDf925OQtQo0mbfWVtgj8C/VzaZxgRfgFR8sDuUyCRAsHjOHFiYPWMsykfMmb84QpMe2' +\
+       b'1nDHZINecq53E+Y/rJSBPWjmqOv+egnshDBsNGIJewCNjspyEApAiyujI7V4AAAbgP0h8A' +\
+       b'AEtHuyyxxGf7AgAAAAAEWVo='
+
+
+@instrument(stage=True)
+def plot_volumes(volumes, filepath=None, width=1000):
     """Plot a list of volumes, in litres, against actual Lake George volumes.
 
     Parameters
     ----------
     volumes : [float]
         List of volumes, in litres, like output by lake_george_simple_model.
+    filepath : str, optional
+        Render the plot off-screen to this file instead of showing it.
+    width : int
+        Width in pixels of the rendered plot, longer series are downsampled to it.
     """
-    lgd = b'/Td6WFoAAATm1rRGAgAhARYAAAB0L+Wj4A/RB5xdABiOXARmN07zFZFMzRkdPJlEM5717W' +\
-          b'kTa6QJZTiTMmDCvEoaeY2/hZSQTqmAG72VrutkbTk0X81VxizGkX7hAnsEPbqRMYLqs1K7' +\
-          b'73SPla3TGeF/i18v4z7sIsnGIAs0nOCfiYKJMwYV79ny8fsk/CDRL7qpWyAOu//64AXXfR' +\
-          b'TAvYfLixyDfNuxD43hNOnNrivVrDvv94TLCbS4IDLtL+v36Y7Xie3FwPtwO0WRSrnaBY/4' +\
-          b'sWlQc4PTsvD/64SnBBaTvxrSrDJwZV3qMcin1SCoibMGrkO0f7zhGEC15q/2ZEHNjCUx7A' +\
-          b'RLdGayhOdItEg8LiJmzg7/uyPaFRANyy/woMF+Yzf/SJTA2Fz+K9k8OL2gKg/1ty6QisJ4' +\
-          b'tc8OkcvZvTpLvjGqQVy7fSaRLDTPJGZNn05cL95825Ic7JtXB0OIT0HICfnFUObfVctAeP' +\
-          b'aiFDsdcMsagJBEW8e/IbCGt5BH2GeLoodOEcL0XwZnfZX7JNvZAJBYR5kN+OcCZgua1Qh5' +\
-          b'V3we2SBL9jZL1WYSgoYSoyGPCA79VzOko+pM5WJArSWf8oDWBMCnWUjpugmF7N/29m/QK7' +\
-          b'KeEshwprc3UsgxiFBNGP6qW8rWDJZf9yVo1Yu0lbcTzCIDNe7Aq3JrR3EcY+p36FtH3rOx' +\
-          b'H/ljGO+GDGXO1LaL/GBBWaqHcC7Di5WsgnhUK6aBj1tY4VLc8TsrB4OguCO4h385MTIGPA' +\
-          b'RgW0QUbIb64eNF7A+5D0SeAGWxpcVxLfUOvMwQeXWYw7B6WmHOD0Z8Sg/PrCrI/FCGld32' +\
-          b'U130fDvAlSiJUZvIZR0c2GJeGHFvlWzM58H19UPaQl30F4Zt2LLMyG2AxNEwwdRkrGG92Y' +\
-          b'HshOyoPJkPWGvRPs7QMQqRmAI+2ywoCq/AP4iKsiSkndmgGWkX0c1Gp+rOX/lAtQLWJeaU' +\
-          b'xMqq2tByh+KqydKdZrrIjwF83Z0bkKtmK2+ZKYxvi6FgkCHpYAZaq3WMG8WqVbo/GBRDzg' +\
-          b'DjHXnkmJImNMXqNYN1lt5lwuCrPkhcs2wMlPy/TLb6qS5B4QfYGZkQEAGfW0YAICWdNF7b' +\
-          b'tmCmd/QTQbme1Chkqtcg+QCPjlALoezSwtI5f9koN8AZ9AACiRYcniaiM0FqhtqBsxNqTj' +\
-          b'3XaH9cL2k6FqrV2pvojKes0JzNN/eg1Acvlm6G3F5RDo7EXZlUXCiQr1V8TaA6gvvrW76H' +\
-          b'0WEaEYwh1SjyKlTEqifb3CG7umLDQ3q2uYghdu5qleP8zPX5ynNKvwYwpePjIM1tR2h7eP' +\
-          b'VQSor0CcLHEBDwJWev4mxwsRfmQO2LVKr6oIaHeQSe+iLRPcB3SD/FV/yRsCHZdVDLrAbC' +\
-          b'NimBgcxZCfP2rb7lq41ZhRqgfuQ5rnMdNPR6fgy8pJbjb/XsVq3opY9mOKEfBj5SJqdHbL' +\
-          b'HWhApXbgCxIMzHaQxg/NRLsxMxBhlmWTPyuhA+c0g7RXtvfdhv+0ZdcJHDd7PIN53uoCqO' +\
-          b'54GMIa+TuR3YzPEGzCaWwyRUdW/m2QQHe+smx0SJ5qBTvMTeZbt/RT1C+pUfM7YQceNDAz' +\
-          b'6ccFh/jHe8hNYDPKIEVoby1/KnA6FgoRc8ZwIdREZClW9aWR9u5hOfcOq733k1wc2sN61P' +\
-          b'v4KJoUhIY/Kn0JZACvexy8yDMoBsrcTTJFMgk8jSXkYNMijKpqYU/lbsqQ0jl5EspruVev' +\
-          b'qZmtTQJzlbpeYykbx1X7f36to1YejRMhNBbmljOfEM7UEjBrAHoPrC514nwbw++C9cocO1' +\
-          b'KZ2E4wIpFrdTxcVF3a7rRBvSro+I96I+5FwSaBzaYtYjCLpNfVVhYX54pW30Wjy3MXTxKj' +\
-          b'OUveFfZc5aB7PF2a1D4zyGJMhz9GepYhWb83pZ8uLXlari8oDZwhGh+OQyXeYUwIUnp9n3' +\
-          b'IAhJkrMS29P6cVcp2jqYVxdW0kaJ5PbgNsljlu4jSIanvjTxBwjd3suTGc0UPdP8OL48Dx' +\
-          b'i61GTrhquDuBBF3gAszoo33cnojR8Rsq9GnFZXscewUwgHGHAFGQA6GZ6eOKRo0NuU3DFa' +\
-          b'U4s5DaUAt86afAM0/tq7uIF/f4igwt1gXmLTGY26gx+dW4yWYKqZzmxzzmKvQvTrJHt5xv' +\
-          b'JWEtoh7HfM+cvCLF/Af6CxvxtZ2igmcJY1qE5Bahy/WNK7YgvtWCl0Igsqb2qu2iXrKZt6' +\
-          b'HGn+yO4f7bdwFs9vU65LERrI6kPO+kA09FKENZJV/bL1jr8bXQ3e/jmtdJwH8BYIWwHW2K' +\
-          b'MwyEgBnlpG8D70VopJ4exKuX5PSxwy1wWOJ6SeH/TLEZRxa9lS14Y6tQq5X1qRKJyiErvj' +\
-          b'ccLs8iNH33KtQO6825BNtOyXc59DFzJOXzoR5dME0/vfqCb74l3GiRh1i6G3WE0xM0WgC7' +\
-          b'S6KWb0DpA3sespnMqMtO0Q/uHoiaHguxHVJPhEYw7qJPVoeGxp+ztAPfWJ7yzFpqoSLRxP' +\
-          b'CbVDf925OQtQo0mbfWVtgj8C/VzaZxgRfgFR8sDuUyCRAsHjOHFiYPWMsykfMmb84QpMe2' +\
-          b'1nDHZINecq53E+Y/rJSBPWjmqOv+egnshDBsNGIJewCNjspyEApAiyujI7V4AAAbgP0h8A' +\
-          b'AEtHuyyxxGf7AgAAAAAEWVo='
-    lgv = list(map(int, lzma.decompress(base64.b64decode(lgd)).split(b'|')))
+    lgv = actual_volumes()
+    if filepath is not None:
+        figure = line_figure(filepath, [(range(len(volumes)), volumes, 'Given volume', None),
+                                        (range(348), lgv, 'Actual Lake George volume', None)],
+                             'Month', 'Volume ($L$)', width=width)
+        render_figure(figure)
+        return
+    # loaded on first use, most users of this module never plot
+    import matplotlib.pyplot as plt
     plt.plot(range(len(volumes)), volumes, label='Given volume')
     plt.plot(range(348), lgv, label='Actual Lake George volume')
     plt.xlabel('Month')
@@ -70,17 +90,170 @@ def plot_volumes(volumes):
     plt.show()
 
 
-def volume_to_area(volume):
+def actual_volumes():
+    """Actual Lake George volumes, in litres, of every month from January 1990.
+
+    Decoded once, later calls return the same read-only array.
+
+    Returns
+    -------
+    numpy array of float, 348 monthly volumes
+    """
+    return _actual_volumes()
+
+
+@functools.lru_cache(maxsize=None)
+def _actual_volumes():
+    """Decodes the actual volumes of _LGD."""
+    volumes = numpy.array(lzma.decompress(base64.b64decode(_LGD)).split(b'|'), dtype=numpy.int64).astype(float)
+    volumes.setflags(write=False)
+    return volumes
+
+
+# Area (square metres) of Lake George as polynomials of volume (litres), below and above VOLUME_BREAKPOINT.
+SMALL_VOLUME_POLYNOMIAL = [4.60493943e-25, -7.14202851e-14, 4.34050787e-03, -2.51895310e+06]
+LARGE_VOLUME_POLYNOMIAL = [7.68888893e-27, -4.92231144e-15, 1.15000089e-03, 4.83203509e+07]
+VOLUME_BREAKPOINT = 6e10
+
+# Lookup table of volume_to_area, see area_table. Cell i + 1 of intercepts and slopes is the line through the
+# areas at both ends of the i-th cell of spacing 1 / inverse_spacing from start, cell 0 is the zero area below start.
+AreaTable = collections.namedtuple(
+    'AreaTable', ['start', 'inverse_spacing', 'intercepts', 'slopes', 'max_volume', 'max_error'])
+
+
+@instrument()
+def volume_to_area(volume, table=None):
     """ Convert the volume of Lake George (in litres) to area (in square metres).
     Parameters
     ----------
-    volume : float
-        Volume in litres.
+    volume : float or numpy array
+        Volume in litres. Arrays of any shape are converted element-wise.
+    table : AreaTable, optional
+        Lookup table made by area_table. Volumes up to its largest volume are
+        linearly interpolated, with error at most table.max_error square metres,
+        about 3 times faster than the polynomials for large arrays.
 
     Updated 20/5/2020, MAM: prevent negative area when volume < 1e8.
     """
-    pf1 = [4.60493943e-25, -7.14202851e-14, 4.34050787e-03, -2.51895310e+06]
-    pf2 = [7.68888893e-27, -4.92231144e-15, 1.15000089e-03, 4.83203509e+07]
-    if volume < 6e10:
+    if table is not None:
+        return _table_volume_to_area(volume, table)
+    pf1 = SMALL_VOLUME_POLYNOMIAL
+    pf2 = LARGE_VOLUME_POLYNOMIAL
+    if numpy.ndim(volume) > 0:
+        volume = numpy.asarray(volume, dtype=float)
+        small_area = numpy.polyval(pf1, volume)
+        return numpy.where(volume < VOLUME_BREAKPOINT, numpy.where(small_area > 0, small_area, 0),
+                           numpy.polyval(pf2, volume))
+    if volume < VOLUME_BREAKPOINT:
         return max(0,numpy.polyval(pf1, volume)) # 20/5/2020, MAM.
     return numpy.polyval(pf2, volume)
+
+
+def area_table(max_volume=4e11, cells=4096):
+    """Make a lookup table for volume_to_area.
+
+    The volumes from where the area reaches zero up to max_volume are split into cells
+    of one spacing h, chosen so VOLUME_BREAKPOINT is a cell edge. The cell of a volume
+    is found directly from its distance to the first edge, and the area is the line
+    through the areas at the cell's edges, so the error is at most
+    h ** 2 / 8 * max|area''|. That bound is stored as max_error; for the defaults it is
+    under 10 square metres.
+
+    Parameters
+    ----------
+    max_volume : float
+        Largest volume, in litres, in the table. Larger volumes are converted exactly.
+    cells : int
+        Number of cells below VOLUME_BREAKPOINT, the cells above it have the same spacing.
+    """
+    zero_volume = _zero_area_volume()
+    spacing = (VOLUME_BREAKPOINT - zero_volume) / cells
+    large_cells = int(numpy.ceil((max(max_volume, VOLUME_BREAKPOINT) - VOLUME_BREAKPOINT) / spacing))
+    edges = zero_volume + spacing * numpy.arange(cells + large_cells + 1)
+    edges[cells] = VOLUME_BREAKPOINT
+    # areas at both edges of every cell from the polynomial of the cell's piece
+    small = numpy.arange(cells + large_cells) < cells
+    left_areas = numpy.where(small, numpy.polyval(SMALL_VOLUME_POLYNOMIAL, edges[:-1]),
+                             numpy.polyval(LARGE_VOLUME_POLYNOMIAL, edges[:-1]))
+    right_areas = numpy.where(small, numpy.polyval(SMALL_VOLUME_POLYNOMIAL, edges[1:]),
+                              numpy.polyval(LARGE_VOLUME_POLYNOMIAL, edges[1:]))
+    left_areas[0] = 0
+    slopes = (right_areas - left_areas) / numpy.diff(edges)
+    intercepts = left_areas - slopes * edges[:-1]
+    max_error = 0.0
+    for pf, ends in ((SMALL_VOLUME_POLYNOMIAL, [zero_volume, VOLUME_BREAKPOINT]),
+                     (LARGE_VOLUME_POLYNOMIAL, [VOLUME_BREAKPOINT, edges[-1]])):
+        # the second derivative of a cubic is linear, so it is largest at an end of the piece
+        curvature = numpy.polyval(numpy.polyder(pf, 2), ends)
+        max_error = max(max_error, spacing ** 2 / 8 * numpy.max(numpy.abs(curvature)))
+    return AreaTable(zero_volume, 1 / spacing, numpy.concatenate(([0.0], intercepts)),
+                     numpy.concatenate(([0.0], slopes)), edges[-1], max_error)
+
+
+@instrument()
+def area_to_volume(area):
+    """Convert the area of Lake George (in square metres) to volume (in litres).
+
+    Inverse of volume_to_area, both polynomial pieces increase with volume. Areas of
+    zero or less give the largest volume with zero area, and areas between the two
+    pieces at VOLUME_BREAKPOINT give VOLUME_BREAKPOINT.
+
+    Parameters
+    ----------
+    area : float or numpy array
+        Area in square metres. Arrays of any shape are converted element-wise.
+    """
+    scalar = numpy.ndim(area) == 0
+    area = numpy.asarray(area, dtype=float)
+    small_areas, small_volumes, large_areas, large_volumes = _inverse_area_table()
+    small = area < small_areas[-1]
+    # start from linear interpolation, then a few Newton steps on the polynomial of each piece
+    volume = numpy.where(small, numpy.interp(area, small_areas, small_volumes),
+                         numpy.interp(area, large_areas, large_volumes))
+    a, b, c, d = (numpy.where(small, p1, p2) for p1, p2 in zip(SMALL_VOLUME_POLYNOMIAL, LARGE_VOLUME_POLYNOMIAL))
+    for _ in range(4):
+        value = ((a * volume + b) * volume + c) * volume + d
+        slope = (3 * a * volume + 2 * b) * volume + c
+        volume = volume - (value - area) / slope
+    volume = numpy.where(small, numpy.clip(volume, small_volumes[0], VOLUME_BREAKPOINT),
+                         numpy.maximum(volume, VOLUME_BREAKPOINT))
+    volume = numpy.where(area <= 0, small_volumes[0], volume)
+    if scalar:
+        return float(volume)
+    return volume
+
+
+def _table_volume_to_area(volume, table):
+    """volume_to_area using an AreaTable."""
+    last = len(table.intercepts) - 1
+    if numpy.ndim(volume) == 0:
+        volume = float(volume)
+        if volume > table.max_volume:
+            return float(numpy.polyval(LARGE_VOLUME_POLYNOMIAL, volume))
+        cell = int(min(max((volume - table.start) * table.inverse_spacing + 1, 0), last))
+        return float(table.intercepts[cell] + table.slopes[cell] * volume)
+    volume = numpy.asarray(volume, dtype=float)
+    # cell of every volume from its distance to the first edge, volumes below it are in the zero area cell 0
+    cell = numpy.clip((volume - table.start) * table.inverse_spacing + 1, 0, last).astype(numpy.intp)
+    area = table.intercepts[cell] + table.slopes[cell] * volume
+    outside = volume > table.max_volume
+    if outside.any():
+        area[outside] = numpy.polyval(LARGE_VOLUME_POLYNOMIAL, volume[outside])
+    return area
+
+
+@functools.lru_cache(maxsize=None)
+def _zero_area_volume():
+    """Volume, in litres, where the small volume polynomial reaches zero area."""
+    roots = numpy.roots(SMALL_VOLUME_POLYNOMIAL)
+    roots = roots[numpy.isreal(roots)].real
+    return float(roots[(roots > 0) & (roots < VOLUME_BREAKPOINT)].min())
+
+
+@functools.lru_cache(maxsize=None)
+def _inverse_area_table(points=256):
+    """Coarse area -> volume nodes of both polynomial pieces, used as first guesses by area_to_volume."""
+    small_volumes = numpy.linspace(_zero_area_volume(), VOLUME_BREAKPOINT, points)
+    large_volumes = numpy.geomspace(VOLUME_BREAKPOINT, 1e13, points)
+    return (numpy.polyval(SMALL_VOLUME_POLYNOMIAL, small_volumes), small_volumes,
+            numpy.polyval(LARGE_VOLUME_POLYNOMIAL, large_volumes), large_volumes)
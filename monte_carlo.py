@@ -0,0 +1,229 @@
+"""
+Monte Carlo uncertainty of predicted Lake George volumes.
+
+Every scenario gets stochastic drivers by block-bootstrapping the historical months: blocks
+of consecutive months are copied from random years, starting at the same calendar month,
+so seasons and the link between rainfall and evaporation are kept. Scenarios are simulated
+in vectorized batches across a process pool, and each batch is reduced straight away to a
+histogram of volumes per month and counts above the thresholds. Memory therefore depends
+on the batch size, not on the number of scenarios, and percentile bands are read from
+the histograms to within one bin width of the empirical (inverted CDF) percentiles.
+Volumes outside the range of the bins are counted in the edge bins, and the share of
+scenarios below and above the range is reported for every month, so bands read from a
+range that is too narrow can be told apart.
+
+Each batch has its own seed, spawned from the seed given, so results are the same for any
+number of workers. With a checkpoint file the reduced batches are saved as they finish, and
+a run interrupted part way continues from them with the same results.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+
+from checkpoints import save_arrays
+from evaporation import evaporation_rates
+from model import COMPLEX_EVAPORATION_FORMULA, date_parts, largest_area, simulate_volumes
+
+# percentiles -> (percentiles, months) volumes, thresholds -> (thresholds, months) probabilities volume exceeds them,
+# below_range and above_range -> (months,) shares of scenarios whose volume is outside volume_range
+MonteCarloResult = collections.namedtuple(
+    'MonteCarloResult', ['percentiles', 'bands', 'thresholds', 'exceedance', 'scenarios', 'bin_width', 'below_range',
+                         'above_range'])
+
+
+def monte_carlo(data, scenarios=1000, evaporation_rate=None, formula=COMPLEX_EVAPORATION_FORMULA,
+                months=None, block_length=12, percentiles=(5, 25, 50, 75, 95), thresholds=(), batch_size=500,
+                workers=None, seed=None, bins=4000, volume_range=None, checkpoint_path=None):
+    """
+    Simulates stochastic scenarios of the simple or complex model and reduces them to percentile bands
+    Parameters
+    ----------
+    data : [pandas DataFrame]
+        dataframe consisting all data from csv file
+    scenarios : [int] - number of scenarios
+    evaporation_rate : [float] - constant evaporation rate (simple model), None for the complex model
+    formula : [EvaporationFormula] - evaporation formula of the complex model, see evaporation.py
+    months : [int] - months simulated from data's first month, len(data) if None
+    block_length : [int] - consecutive historical months copied at a time
+    percentiles : [float] - percentiles (0-100) of the bands
+    thresholds : [float] - volumes, in litres, whose exceedance probability is computed
+    batch_size : [int] - scenarios simulated together, memory grows with batch_size * months
+    workers : [int] - number of worker processes, os.cpu_count() if None, 1 runs in this process
+    seed : [int] - seed of the scenarios, for reproducible runs
+    bins : [int] - number of histogram bins per month, percentiles are exact to one bin width
+    volume_range : [(float, float)] - volumes covered by the bins, 0 to twice the largest recorded volume if None,
+        volumes outside it are counted in the first or last bin and reported in below_range and above_range
+    checkpoint_path : [str] - .npz file the finished batches are saved to, a run with the same data and
+        parameters continues from it. Needs a seed
+    Returns
+    -------
+    MonteCarloResult - bands (percentiles x months), exceedance (thresholds x months), number of scenarios,
+    histogram bin width and the shares of scenarios below and above volume_range every month, bands within a
+    bin of the range are not reliable when these are not 0
+    """
+    months = len(data.index) if months is None else months
+    if volume_range is None:
+        volume_range = (0.0, 2 * float(data.volume.max()))
+    rainfall = np.asarray(data.rainfall, dtype=float)
+    if evaporation_rate is None:
+        evaporation = evaporation_rates(data, formula)
+    else:
+        evaporation = np.full(len(rainfall), float(evaporation_rate))
+    calendar_months = date_parts(data)[1] - 1
+    thresholds = np.asarray(thresholds, dtype=float)
+    task = {'rainfall': rainfall, 'evaporation': evaporation, 'calendar_months': calendar_months,
+            'months': months, 'block_length': block_length, 'catchment_area': largest_area(data),
+            'start_volume': data.volume[0], 'start_area': data.area[0], 'thresholds': thresholds,
+            'bins': bins, 'volume_range': volume_range}
+    sizes = [min(batch_size, scenarios - start) for start in range(0, scenarios, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    histogram = np.zeros((months, bins), dtype=np.int64)
+    exceeded = np.zeros((len(thresholds), months), dtype=np.int64)
+    finished = np.zeros(len(sizes), dtype=bool)
+    # number of volumes below and above volume_range every month
+    outside = np.zeros((2, months), dtype=np.int64)
+    if checkpoint_path is not None:
+        if seed is None:
+            raise ValueError("a seed is needed to continue a run from checkpoint_path")
+        key = _run_key(task, scenarios, batch_size, seed)
+        if os.path.exists(checkpoint_path):
+            with np.load(checkpoint_path) as saved:
+                # a checkpoint of another run, or one without the volumes outside the range, is started over
+                if str(saved['key']) == key and 'outside' in saved.files:
+                    histogram, exceeded, finished = saved['histogram'], saved['exceeded'], saved['finished']
+                    outside = saved['outside']
+    remaining = np.flatnonzero(~finished)
+
+    def add(batch, result):
+        histogram[...] += result[0]
+        exceeded[...] += result[1]
+        outside[...] += result[2]
+        finished[batch] = True
+        if checkpoint_path is not None:
+            save_arrays(checkpoint_path, key=key, histogram=histogram, exceeded=exceeded, finished=finished,
+                        outside=outside)
+
+    if workers == 1:
+        for batch in remaining:
+            add(batch, _run_batch(task, sizes[batch], seeds[batch]))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # at most two batches per worker are in flight and each result is dropped once added,
+            # so memory does not grow with the number of scenarios
+            batches = iter(remaining)
+            futures = {}
+            for batch in itertools.islice(batches, 2 * workers):
+                futures[executor.submit(_run_batch, task, sizes[batch], seeds[batch])] = batch
+            while futures:
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    batch = futures.pop(future)
+                    add(batch, future.result())
+                    for batch in itertools.islice(batches, 1):
+                        futures[executor.submit(_run_batch, task, sizes[batch], seeds[batch])] = batch
+    bands = histogram_percentiles(histogram, percentiles, volume_range)
+    bin_width = (volume_range[1] - volume_range[0]) / bins
+    below_range, above_range = outside / max(scenarios, 1)
+    return MonteCarloResult(tuple(percentiles), bands, tuple(thresholds), exceeded / max(scenarios, 1), scenarios,
+                            bin_width, below_range, above_range)
+
+
+def bootstrap_indices(calendar_months, months, block_length, scenarios, rng, first_month=None):
+    """
+    Picks historical months for every scenario month by moving block bootstrap aligned to calendar months
+    Parameters
+    ----------
+    calendar_months : [numpy array of int] - calendar month (0-11) of every historical month
+    months : [int] - months per scenario
+    block_length : [int] - consecutive historical months copied at a time
+    scenarios : [int] - number of scenarios
+    rng : [numpy Generator] - random generator
+    first_month : [int] - calendar month (0-11) of the first scenario month, calendar_months[0] if None
+    Returns
+    -------
+    numpy array of int, shape (scenarios, months) - historical month of every scenario month
+    """
+    history = len(calendar_months)
+    block_length = min(block_length, history)
+    first_month = calendar_months[0] if first_month is None else first_month
+    # block starts of each calendar month, a block must fit in the history
+    starts = [np.flatnonzero(calendar_months[:history - block_length + 1] == month) for month in range(12)]
+    indices = np.empty((scenarios, months), dtype=np.int64)
+    offsets = np.arange(block_length)
+    for block_start in range(0, months, block_length):
+        candidates = starts[(first_month + block_start) % 12]
+        if len(candidates) == 0:
+            candidates = np.arange(history - block_length + 1)
+        chosen = candidates[rng.integers(len(candidates), size=scenarios)]
+        length = min(block_length, months - block_start)
+        indices[:, block_start:block_start + length] = chosen[:, np.newaxis] + offsets[:length]
+    return indices
+
+
+def histogram_percentiles(histogram, percentiles, volume_range):
+    """
+    Reads percentiles of every month from histograms of volumes, interpolating within a bin
+    Parameters
+    ----------
+    histogram : [numpy array] - (months, bins) counts of volumes in evenly spaced bins
+    percentiles : [float] - percentiles (0-100)
+    volume_range : [(float, float)] - volumes covered by the bins
+    Returns
+    -------
+    numpy array of shape (percentiles, months)
+    """
+    months, bins = histogram.shape
+    edges = np.linspace(volume_range[0], volume_range[1], bins + 1)
+    cumulative = np.cumsum(histogram, axis=1)
+    totals = cumulative[:, -1:]
+    bands = np.empty((len(percentiles), months))
+    for row, percentile in enumerate(percentiles):
+        target = percentile / 100 * totals
+        # first bin where the cumulative count reaches the target
+        index = np.minimum((cumulative < target).sum(axis=1), bins - 1)
+        below = np.where(index > 0, cumulative[np.arange(months), index - 1], 0)
+        inside = histogram[np.arange(months), index]
+        fraction = np.divide(target[:, 0] - below, inside, out=np.zeros(months), where=inside > 0)
+        bands[row] = edges[index] + fraction * (edges[1] - edges[0])
+    return bands
+
+
+def _run_key(task, scenarios, batch_size, seed):
+    """Digest of everything that decides the batches of a run, to tell whether a checkpoint belongs to it."""
+    digest = hashlib.sha256()
+    for name in sorted(task):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(task[name], dtype=float).tobytes())
+    digest.update(json.dumps([scenarios, batch_size, seed]).encode())
+    return digest.hexdigest()
+
+
+def _run_batch(task, size, seed):
+    """
+    Simulates one batch of scenarios and reduces it to its histogram and threshold counts
+    Returns
+    -------
+    ((months, bins) histogram counts, (thresholds, months) counts of volumes above each threshold,
+    (2, months) counts of volumes below and above volume_range)
+    """
+    rng = np.random.default_rng(seed)
+    indices = bootstrap_indices(task['calendar_months'], task['months'], task['block_length'], size, rng)
+    # the first month is the recorded start state, as in the batch models
+    indices[:, 0] = 0
+    volumes = simulate_volumes(task['rainfall'][indices], task['evaporation'][indices], task['catchment_area'],
+                               task['start_volume'], task['start_area'])
+    low, high = task['volume_range']
+    bins = task['bins']
+    bin_index = np.clip(((volumes - low) / (high - low) * bins).astype(np.int64), 0, bins - 1)
+    flat = (np.arange(task['months']) * bins + bin_index).ravel()
+    histogram = np.bincount(flat, minlength=task['months'] * bins).reshape(task['months'], bins)
+    exceeded = (volumes[np.newaxis, :, :] > task['thresholds'][:, np.newaxis, np.newaxis]).sum(axis=1)
+    outside = np.stack([(volumes < low).sum(axis=0), (volumes > high).sum(axis=0)])
+    return histogram, exceeded, outside
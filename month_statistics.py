@@ -0,0 +1,133 @@
+"""
+Calendar months of Lake George data, shared by the statistics of model.py and lake_statistics.py.
+
+Dates come from the period index of periods.py, so they are parsed once per dataset.
+"""
+
+import numpy as np
+
+from periods import period_index, select, time_slice
+
+
+def date_parts(data):
+    """
+    Splits date column (YYYYMM) of every row into years and months
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    Returns
+    -------
+    (years, months) numpy arrays of int, months are 1-12
+    """
+    # from the period index, parsed once per dataset
+    periods = period_index(data)
+    return periods // 12, periods % 12 + 1
+
+
+def index_to_name_month(month_index):
+    """
+    Converts month index(int) 0-11 to respective months
+    Parameters
+    ----------
+    month_index : [int]
+        integer to convert to month name from 0-11
+    Returns
+    Month name(str) to corresponding month_index (0-11)0- January...11-December
+    if index not in between 0-11, returns None
+
+    """
+    if month_index == 0:
+        return 'January'
+    elif month_index == 1:
+        return 'February'
+    elif month_index == 2:
+        return 'March'
+    elif month_index == 3:
+        return 'April'
+    elif month_index == 4:
+        return 'May'
+    elif month_index == 5:
+        return 'June'
+    elif month_index == 6:
+        return 'July'
+    elif month_index == 7:
+        return 'August'
+    elif month_index == 8:
+        return 'September'
+    elif month_index == 9:
+        return 'October'
+    elif month_index == 10:
+        return 'November'
+    elif month_index == 11:
+        return 'December'
+    else:
+        return None
+
+
+def closest_to_mean(data, column, start=None, end=None):
+    """
+    Finds the first row whose value is closest to the column average rounded to 2 decimals,
+    like most_average_rainfall does for rainfall
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    column : [str] - column to search
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    int position of the row in data
+    """
+    rows = time_slice(data, start, end) if start is not None or end is not None else slice(0, len(data))
+    values = np.asarray(data[column], dtype=float)[rows]
+    return rows.start + int(np.argmin(np.abs(values - round(np.mean(values), 2))))
+
+
+def month_closest_to_mean(data, column, date_columns=None, start=None, end=None):
+    """
+    Finds the month and year whose value is closest to the column average, see closest_to_mean
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    column : [str] - column to search
+    date_columns : [(years, months)] - date_parts(data), parsed again if None
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    Month and year (str) like 'October, 2014'
+    """
+    index = closest_to_mean(data, column, start, end)
+    years, months = date_parts(data) if date_columns is None else date_columns
+    return index_to_name_month(months[index] - 1) + ", " + "{:04d}".format(years[index])
+
+
+def highest_average_month(data, column, date_columns=None, start=None, end=None):
+    """
+    Finds the calendar month with the highest average of column
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    column : [str] - column to average
+    date_columns : [(years, months)] - date_parts(data), parsed again if None
+    start, end : [str or int] - first and last month (included) to use, like '2000-01' and '2010-12',
+        all months if None. See periods.select
+    Returns
+    -------
+    month name like 'January', 'February' ...
+    """
+    if date_columns is not None and (start is not None or end is not None):
+        rows = time_slice(data, start, end)
+        date_columns = (date_columns[0][rows], date_columns[1][rows])
+    data = select(data, start, end)
+    months = (date_parts(data) if date_columns is None else date_columns)[1]
+    # sum of the column and number of times each month is added, seperate for 12 months
+    month_sum = np.bincount(months - 1, weights=np.asarray(data[column], dtype=float), minlength=12)
+    month_count = np.bincount(months - 1, minlength=12)
+    # months never in data have average 0
+    month_average = np.divide(month_sum, month_count, out=np.zeros(12), where=month_count != 0)
+    return index_to_name_month(int(np.argmax(month_average)))
@@ -0,0 +1,167 @@
+"""
+Monthly period index of Lake George data and time-range selection.
+
+Every row's date is turned once into a month number (year * 12 + month - 1). read_dataset
+builds this index when it reads a file and it is kept per dataset, so later calls only
+look it up. Start and end bounds, like '2000-01' and '2010-12', resolve to a slice of rows
+with a binary search of the sorted index, without parsing the dates again. The rows select
+returns keep their part of the index.
+
+A copy of the dates is kept with the index and compared with the dates of the dataset on
+every call, so a date changed in place, like data.loc[i, 'date'] = '201001', or a replaced
+date column builds the index again instead of leaving it stale.
+"""
+
+import datetime
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from lake_series import LakeSeries, parse_dates
+
+# id(data) -> (weak reference to data, copy of the dates the index was built from, (month numbers, sorted))
+_cache = {}
+
+
+def period_index(data):
+    """
+    Month numbers (year * 12 + month - 1) of every row, built once per dataset
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    Returns
+    -------
+    read-only numpy array of int
+    """
+    return _indexed(data)[0]
+
+
+def month_number(bound, end=False):
+    """
+    Month number of a start or end bound
+    Parameters
+    ----------
+    bound : [str, int, pandas Period or datetime] - a month like '201012', '2010-12', 201012 or a year like
+        '2010' or 2010. A year starts in January and ends in December
+    end : [bool] - the bound ends a range
+    Returns
+    -------
+    int month number, year * 12 + month - 1
+    """
+    if isinstance(bound, (pd.Period, datetime.date)):
+        return bound.year * 12 + bound.month - 1
+    text = str(bound).strip()
+    digits = text.replace('-', '').replace('/', '')
+    if digits.isdigit() and len(digits) == 4:
+        return int(digits) * 12 + (11 if end else 0)
+    if digits.isdigit() and len(digits) == 6 and 1 <= int(digits[4:]) <= 12:
+        return int(digits[:4]) * 12 + int(digits[4:]) - 1
+    try:
+        period = pd.Period(text, freq='M')
+    except ValueError:
+        raise ValueError("{!r} is not a month or year like '2010-12' or '2010'".format(bound)) from None
+    return period.year * 12 + period.month - 1
+
+
+def time_slice(data, start=None, end=None):
+    """
+    Resolves start and end bounds to the rows between them, with a binary search of the period index
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    start : [str, int, pandas Period or datetime] - first month, see month_number. The first row if None
+    end : [str, int, pandas Period or datetime] - last month, included. The last row if None
+    Returns
+    -------
+    slice of row positions
+    Raises ValueError if the dates of data are not in order
+    """
+    periods, ordered = _indexed(data)
+    if not ordered:
+        raise ValueError("dates of data are not in order, time ranges need sorted dates")
+    first = 0 if start is None else int(np.searchsorted(periods, month_number(start), side='left'))
+    last = len(periods) if end is None else int(np.searchsorted(periods, month_number(end, end=True), side='right'))
+    return slice(first, max(first, last))
+
+
+def select(data, start=None, end=None):
+    """
+    Selects the months from start to end, functions given start and end work on them as if data held only them
+    Parameters
+    ----------
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    start : [str, int, pandas Period or datetime] - first month, see month_number. The first row if None
+    end : [str, int, pandas Period or datetime] - last month, included. The last row if None
+    Returns
+    -------
+    data itself if start and end are None, else the rows between them, sharing memory with data
+    and numbered from 0
+    """
+    if start is None and end is None:
+        return data
+    rows = time_slice(data, start, end)
+    if isinstance(data, LakeSeries):
+        columns = {name: values[rows] for name, values in data.columns.items()}
+        selected = LakeSeries(data.years[rows], data.months[rows], columns, data.dtype)
+    else:
+        selected = data.iloc[rows].reset_index(drop=True)
+    # the selected rows of a sorted index are sorted, their dates are not parsed again
+    _store(selected, _indexed(data)[0][rows], True)
+    return selected
+
+
+def select_months(values, data, start=None, end=None):
+    """
+    Selects the months from start to end of values given for every month of data, like predicted volumes
+    Parameters
+    ----------
+    values : [numpy array or list] - values along the last axis for every month of data,
+        values already covering only the months from start to end are returned as they are
+    data : [pandas DataFrame or LakeSeries]
+        dataframe consisting all data from csv file
+    start : [str, int, pandas Period or datetime] - first month, see month_number. The first row if None
+    end : [str, int, pandas Period or datetime] - last month, included. The last row if None
+    Returns
+    -------
+    numpy array of the values of the months from start to end
+    """
+    values = np.asarray(values)
+    if start is None and end is None or values.ndim == 0 or values.shape[-1] != len(data):
+        return values
+    return values[..., time_slice(data, start, end)]
+
+
+def _indexed(data):
+    """(month numbers, sorted) of data, from the cache while data's dates are the ones it was built from."""
+    reference, dates, indexed = _cache.get(id(data), (None, None, None))
+    if reference is not None and reference() is data and _same_dates(data, dates):
+        return indexed
+    if isinstance(data, LakeSeries):
+        years, months = data.years.astype(np.int64), data.months.astype(np.int64)
+    else:
+        years, months = parse_dates(data['date'])
+    periods = years * 12 + months - 1
+    return _store(data, periods, bool(np.all(periods[1:] >= periods[:-1])))
+
+
+def _store(data, periods, ordered):
+    """Keeps (periods, ordered) as the index of data, with a copy of the dates it is built from."""
+    periods.setflags(write=False)
+    if isinstance(data, LakeSeries):
+        dates = (data.years.copy(), data.months.copy())
+    else:
+        dates = data['date'].copy(deep=True)
+    indexed = (periods, ordered)
+    _cache[id(data)] = (weakref.ref(data, lambda _, key=id(data): _cache.pop(key, None)), dates, indexed)
+    return indexed
+
+
+def _same_dates(data, dates):
+    """True if the dates of data are the copy kept with its index."""
+    if isinstance(data, LakeSeries):
+        return np.array_equal(data.years, dates[0]) and np.array_equal(data.months, dates[1])
+    return data['date'].equals(dates)
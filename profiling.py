@@ -0,0 +1,188 @@
+"""
+Opt-in profiling of the Lake George pipeline.
+
+Profiling is off unless the LAKE_GEORGE_PROFILE environment variable is set to the path of
+a report, or a script is run through this module:
+
+    python profiling.py --output profile.json model.py
+
+Pipeline stages (reading, validation, statistics, models, plotting) record wall time, call
+count and the growth of the process's peak memory, hot functions (like volume_to_area)
+record wall time and call count. The JSON report is written when the process exits.
+
+Functions are instrumented when their module is imported, so profiling has to be enabled
+before the lake modules are imported. When it is off the decorators return the functions
+unchanged and cost nothing. Calls made in worker processes of a process pool are not counted.
+"""
+
+import argparse
+import atexit
+import contextlib
+import functools
+import json
+import os
+import runpy
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, memory is not reported there
+    resource = None
+
+ENVIRONMENT_VARIABLE = 'LAKE_GEORGE_PROFILE'
+
+# None while profiling is off, else the report being recorded and where to write it
+_state = None
+
+
+def enable(path=None):
+    """
+    Starts recording a profile, functions instrumented after this call are timed
+    Parameters
+    ----------
+    path : [str] - JSON file the report is written to at exit, no file if None
+    """
+    global _state
+    if _state is None:
+        atexit.register(_write_at_exit)
+    _state = {'path': path, 'started': time.perf_counter(), 'stages': {}, 'functions': {}}
+
+
+def enabled():
+    """Returns True if a profile is being recorded."""
+    return _state is not None
+
+
+def instrument(name=None, stage=False):
+    """
+    Decorator timing every call of a function while profiling is on
+    Parameters
+    ----------
+    name : [str] - name in the report, module.function if None
+    stage : [bool] - record the function as a pipeline stage, with peak memory, instead of a hot function
+    Returns
+    -------
+    decorator, returning the function unchanged when profiling is off
+    """
+    def decorate(function):
+        if _state is None:
+            return function
+        key = name or function.__module__ + '.' + function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if stage:
+                with _timed_stage(key):
+                    return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(_state['functions'], key, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+def stage(name):
+    """
+    Context manager recording a block of code as a pipeline stage while profiling is on
+    Parameters
+    ----------
+    name : [str] - name of the stage in the report
+    """
+    if _state is None:
+        return contextlib.nullcontext()
+    return _timed_stage(name)
+
+
+def report():
+    """
+    Builds the report of everything recorded so far
+    Returns
+    -------
+    dict with wall_seconds, peak_memory_bytes, argv, stages and functions, None if profiling is off.
+    Every stage has calls, seconds, max_seconds, peak_memory_bytes (peak of the process when the stage
+    last ended) and memory_increase_bytes (largest growth of that peak during one call),
+    every function has calls, seconds and max_seconds
+    """
+    if _state is None:
+        return None
+    return {'wall_seconds': time.perf_counter() - _state['started'], 'peak_memory_bytes': _peak_memory(),
+            'argv': sys.argv, 'stages': _state['stages'], 'functions': _state['functions']}
+
+
+def write_report(path):
+    """
+    Writes report() to a JSON file
+    Parameters
+    ----------
+    path : [str] - path of the file
+    """
+    with open(path, 'w') as file:
+        json.dump(report(), file, indent=2)
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    """Times a stage and records the growth of the process's peak memory during it."""
+    memory = _peak_memory()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = _record(_state['stages'], name, time.perf_counter() - started)
+        peak = _peak_memory()
+        entry['peak_memory_bytes'] = peak
+        if peak is not None:
+            entry['memory_increase_bytes'] = max(entry.get('memory_increase_bytes', 0), peak - memory)
+
+
+def _record(entries, name, seconds):
+    """Adds one call of seconds to the entry of name."""
+    entry = entries.get(name)
+    if entry is None:
+        entry = entries[name] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+    entry['calls'] += 1
+    entry['seconds'] += seconds
+    entry['max_seconds'] = max(entry['max_seconds'], seconds)
+    return entry
+
+
+def _peak_memory():
+    """Peak resident memory of the process in bytes, None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _write_at_exit():
+    if _state is not None and _state['path']:
+        write_report(_state['path'])
+
+
+if os.environ.get(ENVIRONMENT_VARIABLE) and __name__ != '__main__':
+    enable(os.environ[ENVIRONMENT_VARIABLE])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='profile.json', help='JSON file to write the report to')
+    parser.add_argument('script', help='python script to run, like model.py')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help='arguments of the script')
+    args = parser.parse_args(argv)
+    # the lake modules import this file as the profiling module, not as __main__, so it is enabled
+    # through the environment when they import it
+    os.environ[ENVIRONMENT_VARIABLE] = args.output
+    sys.argv = [args.script] + args.arguments
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
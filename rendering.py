@@ -0,0 +1,132 @@
+"""
+Headless rendering of line plots straight to files.
+
+Figures are drawn with matplotlib's Agg canvas, never through pyplot, so nothing is shown
+and no display is needed. Series longer than the target pixel width are downsampled with
+largest-triangle-three-buckets, which keeps peaks and troughs, and independent figures
+can be rendered in a process pool.
+"""
+
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from profiling import instrument
+
+# one line: x values, y values, legend label and color
+Series = collections.namedtuple('Series', ['x', 'y', 'label', 'color'])
+
+# everything needed to render one figure to path
+FigureSpec = collections.namedtuple(
+    'FigureSpec', ['path', 'series', 'x_label', 'y_label', 'title', 'width', 'format'])
+
+DPI = 100
+
+
+def line_figure(path, series, x_label='', y_label='', title='', width=1000, format=None):
+    """
+    Describes a line plot to render with render_figure
+    Parameters
+    ----------
+    path : [str] - file to write the figure to
+    series : [Series or (x, y, label, color)] - lines of the plot
+    x_label : [str] - label for x-axis
+    y_label : [str] - label for y-axis
+    title : [str] - title of the plot
+    width : [int] - width of the figure in pixels, longer series are downsampled to it
+    format : [str] - file format like 'svg' or 'png', taken from the path's extension if None
+    Returns
+    -------
+    FigureSpec
+    """
+    return FigureSpec(path, [Series(*line) for line in series], x_label, y_label, title, width, format)
+
+
+@instrument(stage=True)
+def render_figure(spec):
+    """
+    Renders a figure off-screen and writes it to its file
+    Parameters
+    ----------
+    spec : [FigureSpec] - figure made by line_figure
+    Returns
+    -------
+    str path the figure was written to
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(spec.width / DPI, spec.width * 0.6 / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    for line in spec.series:
+        x, y = lttb(line.x, line.y, spec.width)
+        axes.plot(x, y, color=line.color, label=line.label)
+    if any(line.label for line in spec.series):
+        axes.legend(loc='best')
+    axes.set_xlabel(spec.x_label)
+    axes.set_ylabel(spec.y_label)
+    axes.set_title(spec.title)
+    figure.savefig(spec.path, format=spec.format)
+    return spec.path
+
+
+@instrument(stage=True)
+def render_figures(specs, workers=None):
+    """
+    Renders independent figures in a process pool
+    Parameters
+    ----------
+    specs : [FigureSpec] - figures made by line_figure
+    workers : [int] - number of worker processes, one per figure up to os.cpu_count() if None,
+        1 renders in this process
+    Returns
+    -------
+    list of str paths the figures were written to
+    """
+    specs = list(specs)
+    if workers == 1 or len(specs) < 2:
+        return [render_figure(spec) for spec in specs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_figure, specs))
+
+
+def lttb(x, y, threshold):
+    """
+    Downsamples a series with largest-triangle-three-buckets, keeping its first and last point
+    Parameters
+    ----------
+    x : [float] - x values, increasing
+    y : [float] - y values
+    threshold : [int] - number of points to keep
+    Returns
+    -------
+    (x, y) numpy arrays of at most threshold points, the series itself if it is not longer
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return x, y
+    # the points between first and last are split into threshold - 2 buckets
+    edges = np.linspace(1, size - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = 0
+    kept[-1] = size - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+        else:
+            next_start, next_end = size - 1, size
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+        # area of the triangle from the selected point to each candidate to the next bucket's average
+        area = np.abs((x[selected] - average_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (average_y - y[selected]))
+        area = np.where(np.isfinite(area), area, -1)
+        selected = start + np.argmax(area)
+        kept[bucket + 1] = selected
+    return x[kept], y[kept]
@@ -0,0 +1,122 @@
+"""
+Streaming simulation of Lake George, one month at a time.
+
+LakeSimulator keeps only the previous month's volume and surface area, so a new month
+costs the same however long the record is, and rows can come from a generator.
+"""
+
+import pandas as pd
+
+from checkpoints import Checkpoint
+from model import COMPLEX_EVAPORATION_FORMULA, largest_area
+from model_helpers import volume_to_area
+
+
+class LakeSimulator:
+    """
+    Advances the simple or complex model of Lake George one month at a time
+    (current volume = previous volume + rainfall received - evaporated)
+    Fed the rows after the first one, it predicts the same volumes as lake_george_simple_model
+    (evaporation_rate given) or lake_george_complex_model (evaporation_rate None).
+    Parameters
+    ----------
+    volume : [float] - volume of the lake in the month before the first step, in litres
+    surface_area : [float] - surface area of the lake in that month, in square metres
+    catchment_area : [float] - catchment area, the batch models use largest_area(data)
+    evaporation_rate : [float] - constant evaporation rate (simple model), None for the complex model
+    formula : [EvaporationFormula] - evaporation formula of the complex model, see evaporation.py
+    """
+
+    def __init__(self, volume, surface_area, catchment_area, evaporation_rate=None,
+                 formula=COMPLEX_EVAPORATION_FORMULA):
+        self.volume = volume
+        self.surface_area = surface_area
+        self.catchment_area = catchment_area
+        self.evaporation_rate = evaporation_rate
+        self.formula = formula
+        self.months = 0
+
+    @classmethod
+    def from_data(cls, data, evaporation_rate=None, catchment_area=None, formula=COMPLEX_EVAPORATION_FORMULA):
+        """
+        Starts a simulator from the first month of data, like the batch models
+        Parameters
+        ----------
+        data : [pandas DataFrame]
+            dataframe consisting all data from csv file
+        evaporation_rate : [float] - constant evaporation rate (simple model), None for the complex model
+        catchment_area : [float] - catchment area, largest_area(data) if None
+        formula : [EvaporationFormula] - evaporation formula of the complex model, see evaporation.py
+        Returns
+        -------
+        LakeSimulator whose next step is the second month of data
+        """
+        if catchment_area is None:
+            catchment_area = largest_area(data)
+        return cls(data.volume[0], data.area[0], catchment_area, evaporation_rate, formula)
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, catchment_area, evaporation_rate=None, formula=COMPLEX_EVAPORATION_FORMULA):
+        """
+        Resumes a simulator from a checkpoint
+        Parameters
+        ----------
+        checkpoint : [Checkpoint] - state of a month, see checkpoint
+        catchment_area : [float] - catchment area, the batch models use largest_area(data)
+        evaporation_rate : [float] - constant evaporation rate (simple model), None for the complex model
+        formula : [EvaporationFormula] - evaporation formula of the complex model, see evaporation.py
+        Returns
+        -------
+        LakeSimulator whose next step is the month after the checkpoint's month
+        """
+        simulator = cls(checkpoint.volume, checkpoint.surface_area, catchment_area, evaporation_rate, formula)
+        simulator.months = checkpoint.month
+        return simulator
+
+    def checkpoint(self):
+        """
+        Keeps the state of the last month, to resume from it with from_checkpoint
+        Returns
+        -------
+        Checkpoint of the last month, its month counts the steps from the first month of data
+        """
+        return Checkpoint(self.months, self.volume, self.surface_area)
+
+    def step(self, month_row):
+        """
+        Predicts volume of the next month and keeps it as the simulator state
+        Parameters
+        ----------
+        month_row : [dict or pandas Series]
+            one month of data, with rainfall and, for the complex model, the columns of the formula
+        Returns
+        -------
+        float - predicted volume of the month
+        """
+        evaporation_rate = self.evaporation_rate
+        if evaporation_rate is None:
+            # Evaporation rate changes every month in the complex model
+            evaporation_rate = self.formula.function(month_row)
+        rainfall_received = month_row['rainfall'] * self.catchment_area
+        evaporated = evaporation_rate * self.surface_area
+        self.volume = self.volume + rainfall_received - evaporated
+        # surface area used in next month's prediction
+        self.surface_area = volume_to_area(self.volume)
+        self.months += 1
+        return self.volume
+
+    def step_many(self, rows):
+        """
+        Predicts volumes of many months, one month at a time
+        Parameters
+        ----------
+        rows : [iterable of dict or pandas Series, or pandas DataFrame]
+            months of data in order, may be a generator
+        Returns
+        -------
+        generator of float - predicted volume of every month
+        """
+        if isinstance(rows, pd.DataFrame):
+            rows = (row._asdict() for row in rows.itertuples(index=False))
+        for month_row in rows:
+            yield self.step(month_row)
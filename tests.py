@@ -21,13 +21,36 @@ All these test functions work for this test_data.csv file.
 
 
 
+import asyncio
+import json
+import os
+import shutil
+import subprocess
 import sys
 
 import pytest
 import numpy as np
 import pandas as pd
 
+import assimilation
+import batch_runner
+import forecast_server
+import benchmarks
+import calibration
+import checkpoints
+import evaluation
+import evaporation
+import incremental
+import ingest
+import lake_statistics
 import model as assignment
+import model_helpers
+import profiling
+import monte_carlo
+import periods
+import rendering
+from lake_series import LakeSeries
+from simulator import LakeSimulator
 
 
 def test_read_data():
@@ -52,6 +75,23 @@ def test_read_data():
     assert check[0].size == 0, message3.format(check[0].size, 0)
 
 
+def test_read_data_cache(tmp_path):
+    """
+    Checks cached dataset loads the same data frame and is rebuilt when the csv file changes
+    """
+    message = "Cached data frame should equal data frame read from csv {}"
+    filepath = str(tmp_path / "test_data.csv")
+    shutil.copy("test_data.csv", filepath)
+    cache_dir = str(tmp_path / "cache")
+    expected = assignment.read_dataset(filepath, cache_dir=cache_dir)
+    result = assignment.read_dataset(filepath, cache_dir=cache_dir)
+    assert result.equals(expected) and (result.dtypes == expected.dtypes).all(), message.format('')
+    with open(filepath, 'a') as file:
+        file.write("201507,1000,2000,10,20,15,5,50,1.2\n")
+    result = assignment.read_dataset(filepath, cache_dir=cache_dir)
+    assert len(result.index) == 13, message.format('after the csv file changed')
+
+
 def test_largest_area():
     """
     Checks largest area of test_datset, compares with expected result and asserts it
@@ -100,6 +140,625 @@ def test_hottest_month():
     assert result == expected, message.format(expected, result)
 
 
+def test_impute_dataset():
+    """
+    Checks imputed cells reported for test dataset and that every invalid value is imputed
+    """
+    message = "Changed rows of {} should be {} but function returned {}"
+    message1 = "Invalid values left in {} after imputing"
+    data = pd.read_csv("test_data.csv", dtype={'date': str})
+    data, report = assignment.impute_dataset(data)
+    expected = {'max_temperature': [0, 7], 'min_temperature': [0, 6], 'date': [2, 6], 'volume': [5, 10],
+                'area': [3, 9], 'humidity': [1, 6], 'wind_speed': [7, 10], 'solar_exposure': [1, 4],
+                'rainfall': [0, 3]}
+    for column, rows in expected.items():
+        assert list(report[column]) == rows, message.format(column, rows, list(report[column]))
+    for column in assignment.MEAN_IMPUTED_COLUMNS:
+        assert (data[column] >= 0).all(), message1.format(column)
+    assert (data.max_temperature >= data.min_temperature).all(), message1.format('temperatures')
+    assert list(data.date[[2, 6]]) == ['201409', '000001'], message1.format('date')
+
+
+def test_check_data_validity_rows():
+    """
+    Checks check_data_validity against the row by row pass it replaced, imputed means may differ in the last bit
+    """
+    message = "{} should be {} but function returned {}"
+    expected = pd.read_csv("test_data.csv", dtype={'date': str})
+    # the row by row pass check_data_validity used before
+    for i in range(len(expected.index)):
+        if expected.max_temperature[i] < expected.min_temperature[i]:
+            temp = expected.max_temperature[i]
+            expected.loc[i, 'max_temperature'] = expected.min_temperature[i]
+            expected.loc[i, 'min_temperature'] = temp
+        for column in ['max_temperature', 'min_temperature']:
+            if pd.isnull(expected.loc[i, column]):
+                expected.loc[i, column] = np.mean(expected[column])
+        if pd.isnull(expected.loc[i, 'date']) or len(expected.date[i]) < 5:
+            expected.loc[i, 'date'] = '000001'
+        if len(expected.date[i]) == 5:
+            expected.loc[i, 'date'] = expected.date[i][:4] + '0' + expected.date[i][4:]
+        for column in assignment.MEAN_IMPUTED_COLUMNS:
+            if expected[column][i] < 0 or pd.isnull(expected.loc[i, column]):
+                expected.loc[i, column] = np.mean(expected[column])
+    result = assignment.check_data_validity(pd.read_csv("test_data.csv", dtype={'date': str}))
+    assert list(result.date) == list(expected.date), message.format('Dates', list(expected.date), list(result.date))
+    for column in expected.columns.drop('date'):
+        assert np.allclose(result[column], expected[column], rtol=1e-15, atol=0), \
+            message.format(column, list(expected[column]), list(result[column]))
+
+
+def test_lake_george_batch_model():
+    """
+    Checks every scenario of batch model matches the simple and complex model run on its own
+    """
+    message = "Batch model scenario {} should match {} but does not"
+    data = assignment.read_dataset("test_data.csv")
+    result = assignment.lake_george_batch_model(data, [55, 40])
+    assert result.shape == (2, 12), "Batch model should return (2, 12) volumes but returned {}".format(result.shape)
+    for scenario, rate in enumerate((55, 40)):
+        expected = assignment.lake_george_simple_model(data, rate)
+        assert np.array_equal(result[scenario], expected), message.format(scenario, 'simple model')
+    result = assignment.lake_george_batch_model(data, assignment.complex_evaporation_rates(data)[np.newaxis, :])
+    expected = assignment.lake_george_complex_model(data)
+    assert np.array_equal(result[0], expected), message.format(0, 'complex model')
+
+
+def test_volume_to_area():
+    """
+    Checks array conversion matches scalar conversion and lookup table stays within its error bound
+    """
+    message = "Area of {} litres should be {} but function returned {}"
+    volumes = np.array([[-1e9, 0, 1e8, 5e9], [5.99e10, 6e10, 1e11, 5e11]])
+    result = model_helpers.volume_to_area(volumes)
+    for volume, area in zip(volumes.flat, result.flat):
+        expected = model_helpers.volume_to_area(volume)
+        assert area == expected, message.format(volume, expected, area)
+    table = model_helpers.area_table()
+    volumes = np.concatenate([volumes.ravel(), np.random.default_rng(0).uniform(0, 4.5e11, 100000)])
+    result = model_helpers.volume_to_area(volumes, table)
+    error = np.max(np.abs(result - model_helpers.volume_to_area(volumes)))
+    assert error <= table.max_error, "Lookup table error {} above its bound {}".format(error, table.max_error)
+    for volume, area in zip(volumes[:20], result):
+        expected = model_helpers.volume_to_area(volume, table)
+        assert area == expected, message.format(volume, expected, area)
+
+
+def test_area_to_volume():
+    """
+    Checks area_to_volume inverts volume_to_area on both polynomial pieces
+    """
+    message = "Volume of {} square metres should be {} but function returned {}"
+    volumes = np.array([1e9, 5e9, 5.99e10, 6e10, 1e11, 2e11])
+    result = model_helpers.area_to_volume(model_helpers.volume_to_area(volumes))
+    assert np.allclose(result, volumes, rtol=1e-9), message.format('areas', volumes, result)
+    result = model_helpers.area_to_volume(0)
+    assert model_helpers.volume_to_area(result) == 0, message.format(0, 'a volume with zero area', result)
+
+
+def test_calibrate_complex_model():
+    """
+    Checks calibrated coefficients score better than the default ones and the trace never gets worse
+    """
+    message = "Calibrated loss {} should be below default loss {}"
+    data = assignment.read_dataset("test_data.csv")
+    result = calibration.calibrate_complex_model(data, workers=1, generations=10, population=16, seed=0)
+    default = assignment.evaluate_model(data, assignment.lake_george_complex_model(data))
+    assert result.loss < default, message.format(result.loss, default)
+    assert len(result.trace) == 10, "Trace should have 10 generations but has {}".format(len(result.trace))
+    assert all(np.diff(result.trace) <= 0), "Best loss got worse in trace {}".format(result.trace)
+    rates = assignment.complex_evaporation_rates(data, result.coefficients)
+    volumes = assignment.lake_george_batch_model(data, rates[np.newaxis, :], catchment_areas=result.catchment_area)
+    expected = assignment.evaluate_model(data, volumes[0])
+    assert np.isclose(result.loss, expected), "Loss should be {} but is {}".format(expected, result.loss)
+    formula = evaporation.linear_formula({'max_temperature': 0, 'humidity': -0.5}, intercept=10)
+    result = calibration.calibrate_complex_model(data, workers=1, generations=3, population=8, seed=0,
+                                                 formula=formula)
+    assert result.coefficients[0] != 0, "A coefficient starting at 0 should be searched"
+    with pytest.raises(ValueError):
+        calibration.calibrate_complex_model(data, workers=1, generations=0)
+
+
+def test_lake_simulator():
+    """
+    Checks stepping the simulator through test dataset predicts the same volumes as the simple and complex model
+    """
+    message = "Simulator should predict {} volumes like {} but predicted {}"
+    data = assignment.read_dataset("test_data.csv")
+    simulator = LakeSimulator.from_data(data, evaporation_rate=55)
+    result = [data.volume[0]] + list(simulator.step_many(data.iloc[1:]))
+    expected = assignment.lake_george_simple_model(data, 55)
+    assert result == expected, message.format('simple model', expected, result)
+    simulator = LakeSimulator.from_data(data)
+    rows = (row for _, row in data.iloc[1:].iterrows())
+    result = [data.volume[0]] + [simulator.step(row) for row in rows]
+    expected = assignment.lake_george_complex_model(data)
+    assert result == expected, message.format('complex model', expected, result)
+    assert simulator.months == 11, "Simulator should have stepped 11 months but stepped {}".format(simulator.months)
+
+
+def test_synthetic_dataset():
+    """
+    Checks synthetic benchmark dataset has the columns of the data file and validates without missing values
+    """
+    message = "Synthetic dataset columns should be {} but are {}"
+    expected = list(pd.read_csv("test_data.csv", nrows=0).columns)
+    data = benchmarks.synthetic_dataset(1000, invalid_fraction=0.05)
+    assert list(data.columns) == expected, message.format(expected, list(data.columns))
+    assert len(data.index) == 1000, "Synthetic dataset should have 1000 rows but has {}".format(len(data.index))
+    data = assignment.check_data_validity(data)
+    assert not pd.isnull(data).any().any(), "Validated synthetic dataset still has missing values"
+    # the copy of the dataset each benchmark runs on is not part of its peak memory
+    result = benchmarks.run_benchmarks([20000], ['largest_area'], repeat=1)[0]['peak_memory_bytes']
+    dataset_size = benchmarks.synthetic_dataset(20000).memory_usage(deep=True).sum()
+    assert result < dataset_size / 4, "largest_area peak memory {} counts the dataset".format(result)
+
+
+def test_lttb():
+    """
+    Checks downsampled series keeps its length limit, first and last point and a single spike
+    """
+    x = np.arange(10000)
+    y = np.zeros(10000)
+    y[4321] = 50
+    result_x, result_y = rendering.lttb(x, y, 100)
+    assert len(result_x) == 100, "Downsampled series should have 100 points but has {}".format(len(result_x))
+    assert result_x[0] == 0 and result_x[-1] == 9999, "First and last point should be kept"
+    assert 4321 in result_x, "Spike at 4321 should be kept but points are {}".format(result_x)
+    result_x, result_y = rendering.lttb(x[:50], y[:50], 100)
+    assert len(result_x) == 50, "Short series should not be downsampled"
+
+
+def test_plot_graph_headless(tmp_path):
+    """
+    Checks plot_graph renders off-screen to its file when not shown
+    """
+    image_name = str(tmp_path / "graph")
+    assignment.plot_graph(range(5000), np.random.rand(5000), np.random.rand(5000), 'y', image_name, show=False)
+    with open(image_name) as file:
+        content = file.read()
+    assert content.lstrip().startswith('<?xml') and 'volumes' in content, "Graph should be written as svg"
+
+
+def test_actual_volumes():
+    """
+    Checks actual volumes are decoded once into a read-only array and importing model does not load matplotlib
+    """
+    result = model_helpers.actual_volumes()
+    assert result.shape == (348,), "Actual volumes should have 348 months but have {}".format(result.shape)
+    assert not result.flags.writeable, "Actual volumes should be read-only"
+    assert model_helpers.actual_volumes() is result, "Actual volumes should be decoded once"
+    code = "import sys, model; sys.exit('matplotlib' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0, "Importing model should not load matplotlib"
+
+
+def test_summary_statistics():
+    """
+    Checks summary statistics of test dataset match the single statistic functions and grouped reductions
+    """
+    message = "Summary {} should be {} but is {}"
+    data = assignment.read_dataset("test_data.csv")
+    result = lake_statistics.summary_statistics(data)
+    for name in ('largest_area', 'average_volume', 'most_average_rainfall', 'hottest_month'):
+        expected = getattr(assignment, name)(data)
+        assert result[name] == expected, message.format(name, expected, result[name])
+    # test dataset has 2014 and 2015, the imputed date 000001 is year 0
+    result_years = list(result['annual_totals'].index)
+    assert result_years == [0, 2014, 2015], message.format('years', [0, 2014, 2015], result_years)
+    seasons = lake_statistics.grouped_statistics(data, 'season', ['rainfall'], ['count'])
+    result = seasons[('rainfall', 'count')].to_dict()
+    expected = {'autumn': 3, 'spring': 3, 'summer': 3, 'winter': 3}
+    assert result == expected, message.format('season counts', expected, result)
+
+
+def test_run_batch(tmp_path):
+    """
+    Checks batch run summarises every dataset of a directory and reports a bad file without stopping
+    """
+    shutil.copy("test_data.csv", str(tmp_path / "lake_a.csv"))
+    (tmp_path / "lake_b.csv").write_text("date,volume\n201401,1\n")
+    result = batch_runner.run_batch(str(tmp_path), workers=1)
+    assert list(result.file) == [str(tmp_path / "lake_a.csv"), str(tmp_path / "lake_b.csv")], \
+        "Batch should run both files but ran {}".format(list(result.file))
+    assert pd.isnull(result.error[0]) and result.hottest_month[0] == 'December', "First file should succeed"
+    assert not pd.isnull(result.error[1]), "Error of bad file should be reported"
+
+
+def test_monthly_rows(tmp_path):
+    """
+    Checks daily rows are aggregated to months the same way whatever the chunk size
+    """
+    message = "Monthly {} should be {} but is {}"
+    lines = ["date,volume,area,solar_exposure,rainfall,max_temperature,min_temperature,humidity,wind_speed"]
+    for day in range(1, 6):
+        lines.append("201401{:02d},{},{},10,{},20,10,50,1".format(day, day * 100, day * 10, day))
+    for day in range(1, 4):
+        lines.append("201402{:02d},{},{},20,2,30,10,40,2".format(day, 1000 + day, 500 + day))
+    filepath = tmp_path / "daily.csv"
+    filepath.write_text("\n".join(lines) + "\n")
+    for chunksize in (2, 3, 100):
+        result = list(ingest.monthly_rows(str(filepath), chunksize=chunksize))
+        dates = [row['date'] for row in result]
+        assert dates == ['201401', '201402'], message.format('dates', ['201401', '201402'], dates)
+        assert result[0]['rainfall'] == 15, message.format('rainfall', 15, result[0]['rainfall'])
+        assert result[0]['volume'] == 500, message.format('volume', 500, result[0]['volume'])
+        assert result[1]['max_temperature'] == 30, message.format('max temperature', 30, result[1]['max_temperature'])
+        assert result[1]['area'] == 503, message.format('area', 503, result[1]['area'])
+
+
+def test_monte_carlo():
+    """
+    Checks Monte Carlo bands are ordered, start at the recorded volume and are reproducible with a seed
+    """
+    data = assignment.read_dataset("lake_george_data.csv")
+    result = monte_carlo.monte_carlo(data, scenarios=300, months=60, batch_size=100, workers=1, seed=7,
+                                     thresholds=[1e11])
+    assert result.bands.shape == (5, 60), "Bands should be (5, 60) but are {}".format(result.bands.shape)
+    assert np.all(np.diff(result.bands, axis=0) >= 0), "Percentile bands should not cross"
+    assert np.allclose(result.bands[:, 0], data.volume[0], atol=result.bin_width), "First month should be recorded"
+    assert np.all((result.exceedance >= 0) & (result.exceedance <= 1)), "Exceedance should be a probability"
+    again = monte_carlo.monte_carlo(data, scenarios=300, months=60, batch_size=100, workers=1, seed=7,
+                                    thresholds=[1e11])
+    assert np.array_equal(result.bands, again.bands), "Runs with the same seed should be equal"
+    assert not result.below_range.any() and not result.above_range.any(), "Volumes should be inside the bins"
+    # a range below most volumes
+    narrow = monte_carlo.monte_carlo(data, scenarios=300, months=60, batch_size=100, workers=1, seed=7,
+                                     volume_range=(0, data.volume[0] / 2))
+    assert narrow.above_range[0] == 1 and np.all(narrow.below_range == 0), \
+        "Volumes above the range should be reported but are {}".format(narrow.above_range)
+
+
+def test_monte_carlo_memory():
+    """
+    Checks peak memory of a Monte Carlo run does not grow with the number of scenarios
+    """
+    code = ("import resource, model, monte_carlo; data = model.read_dataset('lake_george_data.csv'); "
+            "monte_carlo.monte_carlo(data, scenarios={}, batch_size=100, workers=2, seed=0); "
+            "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)")
+    peaks = [int(subprocess.run([sys.executable, "-c", code.format(scenarios)], capture_output=True, text=True,
+                                check=True).stdout) for scenarios in (400, 2000)]
+    # ru_maxrss is in kilobytes, every batch histogram is about 11 MB
+    assert peaks[1] - peaks[0] < 40 * 1024, "Peak memory grew from {} to {} kB with 5 times the scenarios".format(
+        *peaks)
+
+
+def test_evaluate():
+    """
+    Checks vectorized scores of many predictions match evaluate_model and direct formulas
+    """
+    message = "{} of prediction {} should be {} but is {}"
+    data = assignment.read_dataset("test_data.csv")
+    predictions = assignment.lake_george_batch_model(data, [55, 40])
+    result = evaluation.evaluate(data, predictions)
+    observed = data.volume.to_numpy()
+    for row, predicted in enumerate(predictions):
+        expected = assignment.evaluate_model(data, predicted)
+        assert np.isclose(result['mae'][row], expected), message.format('mae', row, expected, result['mae'][row])
+        expected = 1 - np.sum((predicted - observed) ** 2) / np.sum((observed - observed.mean()) ** 2)
+        assert np.isclose(result['nse'][row], expected), message.format('nse', row, expected, result['nse'][row])
+    perfect = evaluation.evaluate(data, observed)
+    assert np.isclose(perfect['kge'], 1) and perfect['rmse'] == 0, "Recorded volumes should score perfectly"
+    rolling = evaluation.rolling_scores(data, predictions[0], 6, ['mae'])['mae']
+    expected = np.abs(predictions[0] - observed)[3:9].mean()
+    assert np.isclose(rolling[3], expected), message.format('rolling mae', 0, expected, rolling[3])
+    holdout = evaluation.holdout_scores(data, predictions[0], 6, ['bias'])
+    expected = np.mean(predictions[0][6:] - observed[6:])
+    assert np.isclose(holdout['validation']['bias'], expected), \
+        message.format('hold-out bias', 0, expected, holdout['validation']['bias'])
+
+
+def test_evaporation_rates():
+    """
+    Checks declared evaporation formulas match the complex model and reject unsafe expressions
+    """
+    data = assignment.read_dataset("test_data.csv")
+    expected = assignment.complex_evaporation_rates(data)
+    formula = evaporation.expression_formula('1.6 * max_temperature - 3 * min_temperature - 2.5 * wind_speed'
+                                             ' + 4.5 * solar_exposure - 0.4 * humidity')
+    rates = evaporation.evaporation_rates(data, formula)
+    assert np.allclose(rates, expected), "Expression rates should be {} but are {}".format(expected, rates)
+    assert evaporation.evaporation_rates(data, formula) is rates, "Rates should be cached"
+    volumes = assignment.lake_george_complex_model(data)
+    data.loc[5, 'humidity'] = 95
+    expected = assignment.complex_evaporation_rates(data)
+    rates = evaporation.evaporation_rates(data, formula)
+    assert np.allclose(rates, expected), "Rates should follow values changed in place but are {}".format(rates)
+    assert assignment.lake_george_complex_model(data) != volumes, "Volumes should follow values changed in place"
+    with pytest.raises(ValueError):
+        evaporation.expression_formula('__import__("os")')
+    formula = evaporation.linear_formula({'max_temperature': 2, 'humidity': -0.5}, intercept=10)
+    rates = evaporation.evaporation_rates(data, formula)
+    volumes = assignment.lake_george_complex_model(data, formula)
+    expected = assignment.lake_george_batch_model(data, rates[np.newaxis, :])[0]
+    assert np.array_equal(volumes, expected), "Volumes should be {} but are {}".format(expected, volumes)
+    # every model takes the same formula
+    simulator = LakeSimulator.from_data(data, formula=formula)
+    result = [data.volume[0]] + list(simulator.step_many(data.iloc[1:]))
+    assert result == volumes, "Simulator volumes should be {} but are {}".format(volumes, result)
+    service = forecast_server.ForecastService(data)
+    result = service.forecast({"months": 6, "formula": "10 + 2 * max_temperature - 0.5 * humidity"})
+    expected = forecast_server.ForecastService(data, formula=formula).forecast({"months": 6})
+    assert result == expected, "Forecast volumes should be {} but are {}".format(expected, result)
+    with pytest.raises(ValueError):
+        service.forecast({"months": 6, "formula": "2 * area"})
+    result = calibration.calibrate_complex_model(data, workers=1, generations=2, population=8, seed=0,
+                                                 formula=formula)
+    assert result.formula.columns == formula.columns and len(result.coefficients) == 2, \
+        "Calibration should search the coefficients of the formula given"
+    with pytest.raises(ValueError):
+        calibration.calibrate_complex_model(data, workers=1, formula=evaporation.expression_formula('humidity'))
+
+
+def test_lake_series():
+    """
+    Checks a LakeSeries converts back to the data frame and gives the same results as it
+    """
+    message = "{} of LakeSeries should be {} but is {}"
+    data = assignment.read_dataset("test_data.csv")
+    series = LakeSeries.from_frame(data)
+    pd.testing.assert_frame_equal(series.to_frame(), data, check_dtype=False)
+    for function in [assignment.largest_area, assignment.average_volume, assignment.most_average_rainfall,
+                     assignment.hottest_month]:
+        expected = function(data)
+        assert function(series) == expected, message.format(function.__name__, expected, function(series))
+    expected = assignment.lake_george_complex_model(data)
+    result = assignment.lake_george_complex_model(series)
+    assert result == expected, message.format('Complex model', expected, result)
+    predictions = assignment.lake_george_batch_model(series, [55, 40])
+    assert np.array_equal(predictions, assignment.lake_george_batch_model(data, [55, 40])), "Batch models should match"
+    expected = evaluation.period_scores(data, predictions)['mae']
+    result = evaluation.period_scores(series, predictions)['mae']
+    assert result.equals(expected), message.format('Yearly mae', expected, result)
+    compact = LakeSeries.from_frame(data, dtype=np.float32)
+    assert compact.volume.dtype == np.float32 and compact.nbytes < series.nbytes, "float32 columns should be smaller"
+
+
+def test_profiling(tmp_path):
+    """
+    Checks profiling is off by default and reports stages and hot functions when enabled
+    """
+    assert profiling.instrument()(len) is len, "Functions should not be wrapped when profiling is off"
+    path = tmp_path / "profile.json"
+    code = "import model; data = model.read_dataset('test_data.csv'); model.lake_george_simple_model(data, 55)"
+    environment = dict(os.environ, **{profiling.ENVIRONMENT_VARIABLE: str(path)})
+    assert subprocess.run([sys.executable, "-c", code], env=environment).returncode == 0, "Profiled run failed"
+    with open(path) as file:
+        report = json.load(file)
+    assert report['stages']['model.read_dataset']['calls'] == 1, "read_dataset should be reported as a stage"
+    calls = report['functions']['model_helpers.volume_to_area']['calls']
+    assert calls == 11, "volume_to_area should be called 11 times but is called {} times".format(calls)
+
+
+def test_forecast_server():
+    """
+    Checks the forecast service projects like the simulator from the end of the record and caches results
+    """
+    data = assignment.read_dataset("test_data.csv")
+    service = forecast_server.ForecastService(data)
+    drivers = {"rainfall": [10.0, 0.0, 25.5]}
+    result = service.forecast({"drivers": drivers, "evaporation_rate": 55})
+    simulator = LakeSimulator(data.volume.iloc[-1], data.area.iloc[-1], assignment.largest_area(data), 55)
+    expected = list(simulator.step_many({"rainfall": rainfall} for rainfall in drivers["rainfall"]))
+    assert result['volumes'] == expected, "Volumes should be {} but are {}".format(expected, result['volumes'])
+    assert service.forecast({"evaporation_rate": 55, "drivers": drivers}) is result, "Result should be cached"
+
+    async def request(port, body):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        body = json.dumps(body).encode()
+        writer.write(b"POST /forecast HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        response = await reader.read()
+        writer.close()
+        return response.split(b"\r\n\r\n", 1)
+
+    async def run():
+        server = await forecast_server.serve(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        responses = await asyncio.gather(request(port, {"months": 12}), request(port, {"months": 12}),
+                                         request(port, {"months": 0}),
+                                         request(port, {"months": 12, "formula": "9 ** 9 ** 9 ** 9"}),
+                                         request(port, {"months": 12, "evaporation_rate": 10 ** 400}))
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    responses = asyncio.run(run())
+    assert responses[0][0].startswith(b"HTTP/1.1 200") and responses[0][1] == responses[1][1], "Forecasts should match"
+    assert len(json.loads(responses[0][1])['volumes']) == 12, "12 months should be projected"
+    assert responses[2][0].startswith(b"HTTP/1.1 400"), "A forecast of 0 months should be rejected"
+    assert all(response[0].startswith(b"HTTP/1.1 400") for response in responses[3:]), \
+        "Formulas and rates out of range should be rejected"
+    failing = forecast_server.ForecastService(data)
+    failing.forecast = lambda scenario: {}[scenario['months']]
+    server = forecast_server.ForecastServer(failing)
+    status, payload = asyncio.run(server.respond('POST', '/forecast', b'{"months": 1}'))
+    assert status == 500 and 'KeyError' in payload['error'], "Unexpected errors should be answered with 500"
+
+
+def test_checkpoints(tmp_path):
+    """
+    Checks models resumed from a checkpoint, in memory or saved, predict the same volumes as a full run
+    """
+    data = assignment.read_dataset("test_data.csv")
+    expected = assignment.lake_george_simple_model(data, 55)
+    saved = []
+    volumes = assignment.lake_george_batch_model(data, [55], checkpoint_months=range(0, 12, 4),
+                                                 on_checkpoint=saved.append)
+    assert [checkpoint.month for checkpoint in saved] == [0, 4, 8], "Checkpoints should be kept every 4 months"
+    path = str(tmp_path / "checkpoint.npz")
+    checkpoints.save_checkpoint(saved[1], path)
+    resumed = assignment.lake_george_batch_model(data, [55], checkpoint=checkpoints.load_checkpoint(path))
+    assert np.array_equal(resumed, volumes[:, 4:]), "Resumed volumes should be {} but are {}".format(
+        volumes[:, 4:], resumed)
+    checkpoint = checkpoints.Checkpoint(8, float(saved[2].volume[0]), float(saved[2].surface_area[0]))
+    resumed = assignment.lake_george_simple_model(data, 55, checkpoint=checkpoint)
+    assert resumed == expected[8:], "Resumed volumes should be {} but are {}".format(expected[8:], resumed)
+
+
+def test_assimilate():
+    """
+    Checks assimilating observed areas brings the ensemble closer to the recorded volumes than the model alone
+    """
+    data = assignment.read_dataset("lake_george_data.csv")
+    observed = data.area.to_numpy(dtype=float, copy=True)
+    observed[1::2] = np.nan
+    result = assimilation.assimilate(data, observed, members=200, seed=3)
+    error = assignment.evaluate_model(data, result.mean)
+    model_error = assignment.evaluate_model(data, assignment.lake_george_complex_model(data))
+    assert error < model_error / 2, "Error should be below {} but is {}".format(model_error / 2, error)
+    assert np.all(np.isnan(result.innovations[1::2])), "Months without observations should have no innovation"
+    again = assimilation.assimilate(data, observed, members=200, seed=3)
+    assert np.array_equal(result.mean, again.mean), "Runs with the same seed should be equal"
+    # the ensemble covariance needs at least 2 members
+    with pytest.raises(ValueError):
+        assimilation.assimilate(data, observed, members=1, seed=3)
+    with pytest.raises(ValueError):
+        assimilation.assimilate(data, observed, checkpoint=checkpoints.Checkpoint(10, [1e9], [1e7]))
+    with pytest.raises(ValueError):
+        assimilation.assimilate(data, observed, checkpoint=checkpoints.Checkpoint(10, 1e9, 1e7))
+
+
+def test_time_range():
+    """
+    Checks start and end bounds give the same results as the months between them selected by hand
+    """
+    message = "{} from 2000 to 2010 should be {} but is {}"
+    data = assignment.read_dataset("lake_george_data.csv")
+    window = data[(data.date >= '200001') & (data.date <= '201012')].reset_index(drop=True)
+    rows = periods.time_slice(data, '2000-01', '2010-12')
+    assert rows == slice(120, 252) and periods.time_slice(data, 2000, 2010) == rows, \
+        "2000-01 to 2010-12 should be rows 120 to 252 but are {}".format(rows)
+    for function in [assignment.largest_area, assignment.most_average_rainfall, assignment.hottest_month]:
+        expected = function(window)
+        result = function(data, start='2000-01', end='2010-12')
+        assert result == expected, message.format(function.__name__, expected, result)
+    expected = assignment.lake_george_complex_model(window)
+    result = assignment.lake_george_complex_model(data, start='2000', end='2010')
+    assert result == expected, message.format('Complex model', expected, result)
+    volumes = assignment.lake_george_simple_model(data, 55)
+    expected = assignment.evaluate_model(window, volumes[120:252])
+    result = evaluation.evaluate(data, volumes, ['mae'], start='2000', end='2010')['mae']
+    assert np.isclose(result, expected), message.format('Mean absolute error', expected, result)
+
+
+def test_time_range_index(monkeypatch):
+    """
+    Checks the dates of a dataset are parsed once, and a date changed in place builds the index again
+    """
+    data = assignment.read_dataset("lake_george_data.csv")
+    parsed = []
+    parse_dates = periods.parse_dates
+    monkeypatch.setattr(periods, 'parse_dates', lambda dates: parsed.append(len(dates)) or parse_dates(dates))
+    results = {assignment.hottest_month(data, start='2000', end='2010') for _ in range(5)}
+    assert len(results) == 1 and parsed == [], "windowed calls should not parse dates but parsed {}".format(parsed)
+    window = periods.select(data, '2000', '2010')
+    assert periods.time_slice(window, '2005', '2005') == slice(60, 72) and parsed == [], \
+        "selected rows should keep their index"
+    data.loc[251, 'date'] = '201101'
+    assert periods.time_slice(data, '2000-01', '2010-12') == slice(120, 251) and parsed == [len(data)], \
+        "a date changed in place should be indexed again"
+    data['date'] = (data['date'].astype(int) + 100).astype(str)
+    assert periods.time_slice(data, '2000-01', '2010-12') == slice(108, 240) and len(parsed) == 2, \
+        "a replaced date column should be indexed again"
+    # dates read as numbers, the caller's columns stay writable
+    data = pd.read_csv("lake_george_data.csv")
+    results = {assignment.largest_area(data, start='2000', end='2010') for _ in range(3)}
+    assert len(results) == 1 and len(parsed) == 3, "numeric dates should be parsed once"
+    data.loc[0, 'date'] = 190001
+    assert periods.period_index(data)[0] == 1900 * 12 and len(parsed) == 4, "a changed date should be indexed again"
+
+
+def test_incremental_dataset():
+    """
+    Checks running statistics after every appended month match the functions of model on the months so far
+    """
+    message = "{} after {} months should be {} but is {}"
+    data = assignment.read_dataset("lake_george_data.csv")
+    dataset = incremental.IncrementalDataset(impute=False, capacity=1)
+    for size, row in enumerate(data.to_dict('records'), 1):
+        dataset.append(row)
+        months = data.iloc[:size]
+        for name in ['largest_area', 'most_average_rainfall', 'hottest_month']:
+            expected = getattr(assignment, name)(months)
+            result = getattr(dataset, name)()
+            assert result == expected, message.format(name, size, expected, result)
+        expected = assignment.average_volume(months)
+        assert np.isclose(dataset.average_volume(), expected, rtol=0, atol=0.011), \
+            message.format('average_volume', size, expected, dataset.average_volume())
+    result = assignment.lake_george_complex_model(dataset.data)
+    assert result == assignment.lake_george_complex_model(data), "Models should run on the appended months"
+    dataset = incremental.IncrementalDataset()
+    imputed = [dataset.append(row) for row in pd.read_csv("test_data.csv", dtype={'date': str}).to_dict('records')]
+    assert imputed[2] == ['date'] and imputed[5] == ['volume'], "Invalid values should be imputed when appended"
+    assert np.all(dataset.data.volume >= 0) and dataset.data.date[6] == '000001', "Appended months should be valid"
+    with pytest.raises(ValueError):
+        incremental.IncrementalDataset().most_average_rainfall()
+    # missing values are skipped
+    data.loc[3, 'volume'] = np.nan
+    data.loc[5, 'max_temperature'] = np.nan
+    dataset = incremental.IncrementalDataset.from_frame(data)
+    expected = assignment.average_volume(data)
+    assert np.isclose(dataset.average_volume(), expected, rtol=0, atol=0.011), \
+        message.format('average_volume', len(data), expected, dataset.average_volume())
+    expected = assignment.hottest_month(data.drop(index=5))
+    assert dataset.hottest_month() == expected, message.format('hottest_month', len(data), expected,
+                                                               dataset.hottest_month())
+
+
+def test_incremental_rainfall_buckets():
+    """
+    Checks the rainfall buckets stay small as continuous rainfall values are appended, and find the month of model
+    """
+    data = assignment.read_dataset("lake_george_data.csv")
+    size = 40000
+    data = pd.concat([data] * (size // len(data) + 1), ignore_index=True).iloc[:size]
+    data['date'] = ['{:04d}{:02d}'.format(1000 + month // 12, month % 12 + 1) for month in range(size)]
+    data['rainfall'] = np.random.default_rng(0).gamma(2, 30, size)
+    rows = data[ingest.MONTHLY_COLUMNS].to_dict('records')
+    dataset = incremental.IncrementalDataset(impute=False)
+    largest = []
+    for size in [4000, 40000]:
+        dataset.extend(rows[len(dataset):size])
+        expected = assignment.most_average_rainfall(data.iloc[:size])
+        assert dataset.most_average_rainfall() == expected, \
+            "Most average rainfall of {} months should be {} but is {}".format(size, expected,
+                                                                               dataset.most_average_rainfall())
+        largest.append(max(len(bucket) for bucket in dataset.rainfall_buckets.values()))
+    assert max(largest) < 32, "Buckets should hold a few values however many months but hold {}".format(largest)
+
+
+def test_percent_changes(tmp_path, monkeypatch):
+    """
+    Checks % changes match the changes of area_vs_volume computed month by month, and zero references
+    """
+    message = "{} should be {} but is {}"
+    data = assignment.read_dataset("lake_george_data.csv")
+    changes = assignment.percent_changes(data, lags=(1, 12), windows=(12,))
+    volumes = data.volume.to_numpy()
+    expected = [((data.area[i] / data.area[0]) - 1) * 100 for i in range(len(data))]
+    assert np.array_equal(changes['area_baseline'], expected), message.format('Area changes', expected, changes)
+    expected = [((volumes[i] / volumes[i - 12]) - 1) * 100 for i in range(12, len(data))]
+    result = changes['volume_lag_12']
+    assert np.isnan(result[:12]).all() and np.array_equal(result[12:], expected), \
+        message.format('Volume changes from 12 months before', expected, result)
+    expected = (volumes[12:] / data.volume.rolling(12).mean().to_numpy()[11:-1] - 1) * 100
+    assert np.allclose(changes['volume_rolling_12'][12:], expected), \
+        message.format('Volume changes from the 12 months before', expected, changes['volume_rolling_12'])
+    result = assignment.percent_changes({'area': np.array([[0, 0, 5], [2, 4, 0]])}, ['area'], zero_reference=np.inf)
+    expected = {'area_baseline': [[0, 0, np.inf], [0, 100, -100]], 'area_lag_1': [[np.nan, 0, np.inf],
+                                                                                  [np.nan, 100, -100]]}
+    for name, values in expected.items():
+        assert np.array_equal(result[name], values, equal_nan=True), message.format(name, values, result[name])
+    for arguments in [{'baseline': -1}, {'baseline': len(data)}]:
+        with pytest.raises(ValueError, match='baseline'):
+            assignment.percent_changes(data, **arguments)
+    for arguments in [{'baseline': '2000-01'}, {'start': '2000'}]:
+        with pytest.raises(ValueError, match='dict'):
+            assignment.percent_changes({'area': np.arange(3.0)}, ['area'], **arguments)
+    monkeypatch.chdir(tmp_path)
+    assignment.area_vs_volume(data, show=False, changes=changes)
+    assert os.path.exists('Area_vs_volume_previous'), "area_vs_volume should plot the changes given"
+
+
 def test_index_to_name_month():
     """
     Checks the month returned for each index is matching with the expected results or not using the index_to_month_name function